@@ -1,10 +1,36 @@
+import json
 import random
 import numpy as np
-import tensorflow as tf
-import tensorflow.keras as keras
+from replay import ReplayBuffer, PrioritizedReplayBuffer
 #import os
 #os.environ['CUDA_VISIBLE_DEVICES'] = '-1'  # if you want to run this on a cpu instead
 
+# tensorflow takes seconds and hundreds of MB to import, so it is only loaded once a DQN is actually created.
+# processes that only play with a trained model can use NumpyPolicy instead and never load it at all.
+tf = None
+keras = None
+
+
+def _import_tensorflow():
+    global tf, keras
+    if tf is None:
+        import tensorflow
+        import tensorflow.keras
+        tf = tensorflow
+        keras = tensorflow.keras
+
+
+def _child_seeds(seed, count):
+    """
+    Derives independent seeds for the separate random streams of one agent, so that none of them repeats the numbers
+    of another, or of a game (see train_AI.TrainingGame) or anything else seeded with the same seed.
+    :return: list of count seeds, or of count Nones if seed is None
+    """
+    if seed is None:
+        return [None] * count
+    return [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(count)]
+
+
 class DQN:
     """
     Essentially, Deep Q-Learning tries to emulate a Q-table for complex situations.
@@ -14,7 +40,9 @@ class DQN:
     However, for more complex games with a large order of magnitude of states, generating a Q-table is time-consuming
     and resource-intensive, so we try to get a good enough approximation instead.
     """
-    def __init__(self, learning_rate=0.5, discount=0.95, exploration_rate=1.0, iterations=50000, layer_size=32, filepath=None):
+    def __init__(self, learning_rate=0.5, discount=0.95, exploration_rate=1.0, iterations=50000, layer_size=32, filepath=None,
+                 replay_size=0, batch_size=32, train_every=4, prioritized=False, seed=None, target_sync=0,
+                 target_tau=1.0, double=False):
         """
         Q-table formula approximated through Deep Q-Learning:
         Q(s, a) = Q(s, a) + learning_rate * [reward + discount * max_expected_Q(s', a) - Q(s, a)]
@@ -26,7 +54,23 @@ class DQN:
         :param exploration_rate: fraction chance that agent will take random action to explore environment
         :param iterations: number of experiences over which exploration rate is decreased to 0
         :param layer_size: number of neurons in each hidden layer of the neural network
+        :param replay_size: number of past experiences to remember for experience replay. If 0, the network is trained
+                            on each experience once, as soon as it happens, instead.
+        :param batch_size: number of remembered experiences the network is trained on at a time
+        :param train_every: number of experiences to collect between each training step on a batch
+        :param prioritized: if True, experiences with a larger error are replayed more often
+        :param seed: seed for the random moves and for picking which experiences to replay, to make runs reproducible
+        :param target_sync: if not 0, max_expected_Q is estimated by a separate target network, which only catches up
+                            with the network being trained every target_sync training steps. Chasing estimates that
+                            change with every step makes training unstable, and this keeps them still in between.
+        :param target_tau: fraction of the way the target network is moved towards the trained one at every sync.
+                           1 copies it outright, smaller values (e.g. 0.01 with target_sync=1) make it follow smoothly
+        :param double: if True, the trained network picks the best next action and the target network only estimates
+                       its value (Double DQN), which stops max_expected_Q from being overestimated. Needs target_sync
         """
+        if double and not target_sync:
+            raise ValueError("Double DQN needs a target network, set target_sync as well")
+        _import_tensorflow()
         self.learning_rate = learning_rate
         # a higher discount rate allows rewards of a good action to "seep through" to the actions that led to it,
         # which is important in a game like pong where only a few frames really decide whether a series of actions as
@@ -42,6 +86,21 @@ class DQN:
         self.input_count = 5
         self.output_count = 3  # up, stay, or down; all mutually exclusive outputs
 
+        # experience replay - training on random batches of remembered experiences reuses each experience several times
+        # and avoids the overhead of calling into keras for every single frame
+        self.batch_size = batch_size
+        self.train_every = train_every
+        self.steps = 0  # experiences collected so far, to know when to train next
+        random_seed, rng_seed, replay_seed = _child_seeds(seed, 3)
+        self.random = random.Random(random_seed)  # for picking random moves one state at a time
+        self.rng = np.random.default_rng(rng_seed)  # for picking random moves for many states at once
+        if not replay_size:
+            self.replay = None
+        elif prioritized:
+            self.replay = PrioritizedReplayBuffer(replay_size, self.input_count, seed=replay_seed)
+        else:
+            self.replay = ReplayBuffer(replay_size, self.input_count, seed=replay_seed)
+
         if filepath:
             self.model = keras.models.load_model(filepath)
         else:
@@ -57,6 +116,24 @@ class DQN:
             optimizer = keras.optimizers.SGD(learning_rate=self.learning_rate)
             self.model.compile(loss="mse", optimizer=optimizer)  # builds the neural network
 
+        # traced once with a fixed input signature so that inference runs as a compiled graph instead of eagerly,
+        # and any number of states (e.g. both paddles at once) can be served by a single forward pass without retracing
+        self._predict = tf.function(lambda states: self.model(states, training=False),
+                                    input_signature=[tf.TensorSpec(shape=(None, self.input_count), dtype=tf.float32)])
+
+        self.target_sync = target_sync
+        self.target_tau = target_tau
+        self.double = double
+        self.train_steps = 0
+        if target_sync:
+            self.target_model = keras.models.clone_model(self.model)
+            self.target_model.set_weights(self.model.get_weights())
+            self._predict_target = tf.function(
+                lambda states: self.target_model(states, training=False),
+                input_signature=[tf.TensorSpec(shape=(None, self.input_count), dtype=tf.float32)])
+        else:
+            self.target_model = None
+
     # Ask model to estimate Q value for specific state (inference)
     def get_Q(self, state):
         """
@@ -65,16 +142,35 @@ class DQN:
         :return: list containing Q-table values for each action (i.e. list of 3 values for up, stay and down respectively).
                  Obviously, using argmax determines which of the three indexes has a higher value and should be picked.
         """
-        state_tensor = tf.convert_to_tensor(state)
-        state_tensor = tf.expand_dims(state_tensor, 0)
-        return np.array(self.model(state_tensor)[0])
+        return self.get_Q_batch([state])[0]
+
+    def get_Q_batch(self, states):
+        """
+        Same as get_Q, but for many states at once using a single forward pass through the network.
+        :param states: array of shape (N, 5), one state per row
+        :return: array of shape (N, 3) with the Q-table values of each state
+        """
+        return self._predict(np.asarray(states, dtype=np.float32)).numpy()
 
     def get_next_action(self, state):
-        if random.random() > self.exploration_rate:
+        if self.random.random() > self.exploration_rate:
             return np.argmax(self.get_Q(state))  # chooses the best option from knowledge gained so far
         else:
             # 0 is up, 1 is stay, 2 is down
-            return random.randrange(0, 3)  # explores more by selecting a random move
+            return self.random.randrange(0, 3)  # explores more by selecting a random move
+
+    def get_next_actions(self, states):
+        """
+        Same as get_next_action, but picks an action for every row of states with at most one forward pass.
+        :param states: array of shape (N, 5), one state per row
+        :return: integer array of N actions
+        """
+        explore = self.rng.random(len(states)) <= self.exploration_rate
+        actions = self.rng.integers(0, 3, size=len(states))  # explores more by selecting random moves
+        if not explore.all():  # no need to ask the network at all if every move is random
+            greedy = np.argmax(self.get_Q_batch(states), axis=1)
+            actions[~explore] = greedy[~explore]
+        return actions
 
     def train(self, old_state, action, reward, new_state):
         """
@@ -86,22 +182,321 @@ class DQN:
         :param reward: immediate reward for the action taken
         :param new_state: state after the action, used to calculate potential long-term rewards of the action
         """
-        old_state_Q_values = self.get_Q(old_state)
-        new_state_Q_values = self.get_Q(new_state)
+        self.train_batch(np.array([old_state]), np.array([action]), np.array([reward]), np.array([new_state]))
+
+    def train_batch(self, old_states, actions, rewards, new_states, weights=None):
+        """
+        Same as train, but for a whole batch of experiences at once, which only needs a single optimizer step.
+        :param weights: optional importance of each experience in the batch, e.g. from prioritized replay
+        :return: array of how far off the network's old estimate was for each experience (the TD errors)
+        """
+        old_states = np.asarray(old_states, dtype=np.float32)
+        new_states = np.asarray(new_states, dtype=np.float32)
+        count = len(old_states)
+        rows = np.arange(count)
+        # old and new states go through each network together, in a single forward pass
+        if self.target_model is None:
+            Q_values = self.get_Q_batch(np.concatenate((old_states, new_states)))
+            old_state_Q_values = Q_values[:count]
+            max_expected_Q = np.amax(Q_values[count:], axis=1)
+        else:
+            target_Q_values = self._predict_target(new_states).numpy()
+            if self.double:
+                Q_values = self.get_Q_batch(np.concatenate((old_states, new_states)))
+                old_state_Q_values = Q_values[:count]
+                max_expected_Q = target_Q_values[rows, np.argmax(Q_values[count:], axis=1)]
+            else:
+                old_state_Q_values = self.get_Q_batch(old_states)
+                max_expected_Q = np.amax(target_Q_values, axis=1)
 
         # Real Q value for the action we took. This is what we will train towards.
         # Recall the Q-table formula from the constructor!
         # This is slightly modified as the neural network itself takes care of applying the learning rate so we don't have to.
-        old_state_Q_values[action] = reward + self.discount * np.amax(new_state_Q_values)
+        targets = old_state_Q_values.copy()
+        targets[rows, actions] = rewards + self.discount * max_expected_Q
+
+        # Outputs of training_input are optimized to move towards target_output (stored in targets)
+        self.model.train_on_batch(old_states, targets, sample_weight=weights)
+        self.train_steps += 1
+        if self.target_model is not None and self.train_steps % self.target_sync == 0:
+            self.sync_target(self.target_tau)
+        return targets[rows, actions] - old_state_Q_values[rows, actions]
 
-        # Outputs of training_input are optimized to move towards target_output (stored in old_state_Q_values)
-        self.model.fit(np.array([old_state]), np.array([old_state_Q_values]), verbose=0)
+    def sync_target(self, tau=1.0):
+        """
+        Moves the target network's weights tau of the way towards the trained network's (all the way if tau is 1).
+        """
+        for target, weight in zip(self.target_model.weights, self.model.weights):
+            target.assign(weight if tau == 1 else tau * weight + (1 - tau) * target)
+
+    def train_replay(self):
+        """
+        Trains the network on a random batch of remembered experiences.
+        """
+        indexes, old_states, actions, rewards, new_states, weights = self.replay.sample(self.batch_size)
+        td_errors = self.train_batch(old_states, actions, rewards, new_states, weights)
+        self.replay.update_priorities(indexes, td_errors)
 
     def update(self, old_state, new_state, action, reward):
         # Train our model with the results from the action taken
-        self.train(old_state, action, reward, new_state)
+        if self.replay is None:
+            self.train(old_state, action, reward, new_state)
+        else:
+            # remember the experience, and every train_every experiences learn from a batch of remembered ones
+            self.replay.add(old_state, action, reward, new_state)
+            self.steps += 1
+            if self.steps % self.train_every == 0 and len(self.replay) >= self.batch_size:
+                self.train_replay()
 
         # Shift our exploration_rate toward zero so it eventually only takes the best options.
         if self.exploration_rate > 0:
             self.exploration_rate -= self.exploration_delta
             self.iterations -= 1
+
+    def update_batch(self, old_states, new_states, actions, rewards, max_train_steps=None):
+        """
+        Same as calling update for every experience in the batch, but remembers them all at once. Without experience
+        replay, the network is trained on the whole batch in a single step instead.
+        :param max_train_steps: most training steps to take, or None for one every train_every experiences as update
+                                does. Steps over the limit are skipped, not saved up for later
+        """
+        previous_steps = self.steps
+        self.steps += len(actions)
+        if self.replay is None:
+            self.train_batch(old_states, actions, rewards, new_states)
+        else:
+            self.replay.add_batch(old_states, actions, rewards, new_states)
+            train_steps = self.steps // self.train_every - previous_steps // self.train_every
+            if max_train_steps is not None:
+                train_steps = min(train_steps, max_train_steps)
+            for _ in range(train_steps):
+                if len(self.replay) >= self.batch_size:
+                    self.train_replay()
+
+        if self.exploration_rate > 0:
+            self.exploration_rate = max(self.exploration_rate - len(actions) * self.exploration_delta, 0)
+            self.iterations = max(self.iterations - len(actions), 0)
+
+    def export(self, filepath):
+        """
+        Saves just the weights and biases of the network to a small .npz file that NumpyPolicy can load without
+        needing tensorflow.
+        :param filepath: file to save to, the .npz extension is added if missing
+        """
+        weights = self.model.get_weights()  # alternating kernel and bias of each Dense layer
+        arrays = {}
+        for i in range(len(weights) // 2):
+            arrays['kernel_' + str(i)] = weights[2 * i].astype(np.float32)
+            arrays['bias_' + str(i)] = weights[2 * i + 1].astype(np.float32)
+        np.savez(filepath, **arrays)
+
+
+class NumpyPolicy:
+    """
+    Runs a trained DQN network using nothing but NumPy, for playing or evaluating a model without loading tensorflow.
+    The network is just a few Dense layers, so a forward pass is a handful of matrix multiplications.
+    """
+    def __init__(self, weights=None, filepath=None, exploration_rate=0.0, seed=None):
+        """
+        :param weights: list of alternating kernels and biases, as returned by model.get_weights()
+        :param filepath: .npz file saved by DQN.export or a checkpoint, used instead of weights
+        :param exploration_rate: fraction chance of taking a random action instead of the best one
+        :param seed: seed for the random actions
+        """
+        if filepath:
+            with np.load(filepath) as data:  # also works for checkpoints, which store the weights the same way
+                weights = []
+                layer = 0
+                while 'kernel_' + str(layer) in data:
+                    weights.extend([data['kernel_' + str(layer)], data['bias_' + str(layer)]])
+                    layer += 1
+        self.set_weights(weights)
+        self.exploration_rate = exploration_rate
+        random_seed, rng_seed = _child_seeds(seed, 2)
+        self.random = random.Random(random_seed)
+        self.rng = np.random.default_rng(rng_seed)
+
+    def set_weights(self, weights):
+        """
+        :param weights: list of alternating kernels and biases, as returned by model.get_weights()
+        """
+        self.kernels = [np.array(kernel, dtype=np.float32) for kernel in weights[0::2]]
+        self.biases = [np.array(bias, dtype=np.float32) for bias in weights[1::2]]
+
+    def get_weights(self):
+        """
+        :return: list of alternating kernels and biases, in the same order as model.get_weights()
+        """
+        return [array for layer in zip(self.kernels, self.biases) for array in layer]
+
+    def get_Q(self, state):
+        return self.get_Q_batch([state])[0]
+
+    def get_Q_batch(self, states):
+        """
+        :param states: array of shape (N, 5), one state per row
+        :return: array of shape (N, 3) with the Q-table values of each state
+        """
+        values = np.asarray(states, dtype=np.float32)
+        last = len(self.kernels) - 1
+        for i, (kernel, bias) in enumerate(zip(self.kernels, self.biases)):
+            values = values @ kernel + bias
+            if i != last:  # hidden layers use sigmoid activation, the output layer is linear
+                values = 1 / (1 + np.exp(-values))
+        return values
+
+    def get_next_action(self, state):
+        if self.exploration_rate and self.random.random() <= self.exploration_rate:
+            return self.random.randrange(0, 3)
+        return np.argmax(self.get_Q(state))
+
+    def get_next_actions(self, states):
+        actions = np.argmax(self.get_Q_batch(states), axis=1)
+        if self.exploration_rate:
+            explore = self.rng.random(len(actions)) <= self.exploration_rate
+            actions[explore] = self.rng.integers(0, 3, size=int(np.count_nonzero(explore)))
+        return actions
+
+
+class FollowPolicy:
+    """
+    A scripted player that always moves in the recommended direction (the first value of its state), i.e. towards where
+    the ball is predicted to arrive. It never learns and always plays the same way, which makes it a fixed opponent to
+    measure trained models against.
+    """
+    def get_next_action(self, state):
+        return int(state[0]) + 1  # -1 (up), 0 (stay) and 1 (down) map to the actions 0, 1 and 2
+
+    def get_next_actions(self, states):
+        return np.asarray(states)[:, 0].astype(np.int64) + 1
+
+
+class QTable:
+    """
+    The Q-table that DQN approximates, made small enough to build directly by cutting each of the 5 inputs into a few
+    bins. Every state then maps to one cell of a dense array, so looking up and updating a Q value costs a handful of
+    arithmetic operations instead of a pass through a neural network, and no tensorflow is needed at all.
+    Has the same interface as DQN, so it can be trained and played with in the same way.
+    """
+    def __init__(self, bins=(3, 8, 16, 16, 9), low=(-1, 0, 0, 0, -1), high=(1, 1, 1, 1, 1), learning_rate=0.1,
+                 discount=0.95, exploration_rate=1.0, iterations=50000, filepath=None, seed=None):
+        """
+        :param bins: number of bins each input is cut into. The default keeps every recommended direction apart, and
+                     the ball's yvel (in steps of 2, so 9 values between -8 and 8) exact
+        :param low: lowest value of each input, anything lower goes into the first bin
+        :param high: highest value of each input, anything higher goes into the last bin
+        :param learning_rate: fraction of the way each Q value is moved towards its new estimate with every update
+        :param filepath: file saved by save (or a .npy table saved by older versions) to load only the table from, which
+                         also decides the number of bins. QTable.load also restores the rest of what was saved with it
+        Other parameters are the same as for DQN.
+        """
+        if filepath:
+            self.table = np.load(filepath) if filepath.endswith('.npy') else self.read(filepath)[0]
+            bins = self.table.shape[:-1]
+        else:
+            self.table = np.zeros(tuple(bins) + (3,), dtype=np.float32)
+        self.bins = tuple(int(count) for count in bins)
+        self.low = np.array(low, dtype=np.float64)
+        self.high = np.array(high, dtype=np.float64)
+        self.scale = np.array(bins, dtype=np.float64) / (self.high - self.low)
+        self.strides = np.array([int(np.prod(self.bins[i + 1:])) for i in range(len(self.bins))], dtype=np.int64)
+        self._q = self.table.reshape(-1, 3)  # a view, so updates through it change table too
+        # plain python copies of the above, since indexing one state at a time is faster without numpy
+        self._dims = list(zip(self.low.tolist(), self.scale.tolist(), [count - 1 for count in self.bins],
+                              self.strides.tolist()))
+
+        self.learning_rate = learning_rate
+        self.discount = discount
+        self.exploration_rate = exploration_rate
+        self.iterations = iterations
+        self.exploration_delta = exploration_rate / iterations if iterations else 0
+        random_seed, rng_seed = _child_seeds(seed, 2)
+        self.random = random.Random(random_seed)
+        self.rng = np.random.default_rng(rng_seed)
+
+    def index(self, state):
+        """
+        :return: row of the flattened table that state falls into
+        """
+        if isinstance(state, np.ndarray):
+            state = state.tolist()
+        row = 0
+        for value, (low, scale, last, stride) in zip(state, self._dims):
+            cell = int((value - low) * scale)
+            row += (0 if cell < 0 else last if cell > last else cell) * stride
+        return row
+
+    def index_batch(self, states):
+        cells = ((np.asarray(states, dtype=np.float64) - self.low) * self.scale).astype(np.int64)
+        return np.clip(cells, 0, np.array(self.bins) - 1) @ self.strides
+
+    def get_Q(self, state):
+        return self._q[self.index(state)]
+
+    def get_Q_batch(self, states):
+        return self._q[self.index_batch(states)]
+
+    def get_next_action(self, state):
+        if self.random.random() > self.exploration_rate:
+            values = self._q[self.index(state)].tolist()  # a python list is quicker to search than np.argmax for 3
+            return values.index(max(values))
+        return self.random.randrange(0, 3)
+
+    def get_next_actions(self, states):
+        actions = np.argmax(self.get_Q_batch(states), axis=1)
+        explore = self.rng.random(len(actions)) <= self.exploration_rate
+        actions[explore] = self.rng.integers(0, 3, size=int(np.count_nonzero(explore)))
+        return actions
+
+    def update(self, old_state, new_state, action, reward):
+        """
+        The Q-table formula from DQN, applied directly to the cell of old_state.
+        """
+        q = self._q
+        old = q[self.index(old_state)]
+        target = reward + self.discount * float(q[self.index(new_state)].max())
+        old[action] += self.learning_rate * (target - old[action])
+
+        if self.exploration_rate > 0:
+            self.exploration_rate -= self.exploration_delta
+            self.iterations -= 1
+
+    def save(self, filepath, game_num=0):
+        """
+        Saves the table as a single .npz file, along with its settings and how far exploration has come down so far, so
+        that load can continue training exactly where it stopped.
+        :param game_num: number of the game training got to, returned by load with the rest of the metadata
+        """
+        metadata = {
+            'game_num': game_num,
+            'exploration_rate': float(self.exploration_rate),
+            'iterations': int(self.iterations),
+            'learning_rate': float(self.learning_rate),
+            'discount': float(self.discount),
+            'low': self.low.tolist(),
+            'high': self.high.tolist(),
+        }
+        np.savez(filepath, table=self.table, metadata=np.array(json.dumps(metadata)))
+
+    @staticmethod
+    def read(filepath):
+        """
+        :return: (table, metadata) saved by save
+        """
+        with np.load(filepath) as data:
+            return data['table'], json.loads(str(data['metadata']))
+
+    @classmethod
+    def load(cls, filepath, **kwargs):
+        """
+        Recreates a table saved by save, ready to continue training, as checkpoint.load_checkpoint does for a DQN.
+        :param kwargs: constructor arguments to use instead of the saved ones, e.g. exploration_rate=0.0 to only play
+        :return: (agent, metadata)
+        """
+        table, metadata = cls.read(filepath)
+        settings = {name: metadata[name] for name in ('learning_rate', 'discount', 'exploration_rate', 'iterations',
+                                                      'low', 'high')}
+        settings.update(kwargs)
+        agent = cls(bins=table.shape[:-1], **settings)
+        agent.table[...] = table
+        return agent, metadata
@@ -0,0 +1,193 @@
+###############################################################################################
+# Vectorized version of the game environment in game_env.py, used to simulate many games at once.
+# Instead of one Paddle/Ball object per game, every game is a row in a set of NumPy arrays, so a
+# single call to step() advances all of the games by one frame without any Python-level loops.
+# The physics are a line-by-line translation of Paddle.move and Ball.move. Run this file directly
+# (or call check_parity) to confirm that both versions still agree frame for frame.
+###############################################################################################
+import numpy as np
+from game_env import Paddle, Ball, w, h
+
+
+class BatchPong:
+    """
+    Holds the state of n_games independent games of pong (always a left and a right paddle and one ball each).
+    Paddle arrays have shape (n_games, 2) and use the same [left, right] order as the paddles list in train_AI.py,
+    ball arrays have shape (n_games,).
+    """
+    # constants copied from Paddle and Ball - check_parity will catch it if they ever drift apart
+    paddle_x = np.array([8, w - 24])
+    paddle_width = 16
+    paddle_height = 80
+    paddle_vel = 4
+    radius = 8
+    softcap = 8
+
+    def __init__(self, n_games, seed=None):
+        """
+        :param n_games: number of games to simulate side by side
+        :param seed: seed for the random starting velocities of the balls
+        """
+        self.n_games = n_games
+        self.rng = np.random.default_rng(seed)
+        self.ball_x = np.zeros(n_games, dtype=np.int64)
+        self.ball_y = np.zeros(n_games, dtype=np.int64)
+        self.ball_xvel = np.zeros(n_games, dtype=np.int64)
+        self.ball_yvel = np.zeros(n_games, dtype=np.int64)
+        self.paddle_y = np.zeros((n_games, 2), dtype=np.int64)
+        self.paddle_currvel = np.zeros((n_games, 2), dtype=np.int64)  # for applying spin to ball
+        self.hits = np.zeros((n_games, 2), dtype=bool)  # which paddle bounced the ball back on the last frame
+        # scratch buffers reused every frame so that stepping doesn't allocate
+        self._x_cooldown = np.zeros(n_games, dtype=bool)
+        self._y_cooldown = np.zeros(n_games, dtype=bool)
+        self._dead = np.zeros(n_games, dtype=bool)
+        self.reset()
+
+    def reset(self, mask=None):
+        """
+        Puts the ball and both paddles back in their starting positions, exactly like creating a new Ball and Paddles.
+        :param mask: boolean array selecting which games to reset, or None to reset all of them
+        """
+        if mask is None:
+            mask = np.ones(self.n_games, dtype=bool)
+        count = int(np.count_nonzero(mask))
+        if not count:
+            return
+        self.ball_x[mask] = w // 2
+        self.ball_y[mask] = h // 2
+        self.ball_xvel[mask] = self.rng.choice([-6, 6], size=count)
+        self.ball_yvel[mask] = self.rng.choice([-4, -2, 0, 2, 4], size=count)  # same as random.randrange(-4, 5, 2)
+        self.paddle_y[mask] = (h - self.paddle_height) // 2
+        self.paddle_currvel[mask] = 0
+
+    def _move_paddles(self, actions):
+        y = self.paddle_y
+        currvel = self.paddle_currvel
+        currvel[:] = 0  # the game loop resets currvel every frame before moving
+        # 0 is up, 1 is stay, 2 is down
+        moving = (actions == 0) & (y > 0)
+        y -= np.where(moving, self.paddle_vel, 0)
+        currvel[moving] = -2
+        clamped = moving & (y < 0)
+        y[clamped] = 0
+        currvel[clamped] = 0
+
+        moving = (actions == 2) & (y < h - self.paddle_height)
+        y += np.where(moving, self.paddle_vel, 0)
+        currvel[moving] = 2
+        clamped = moving & (y > h - self.paddle_height)
+        y[clamped] = h - self.paddle_height
+        currvel[clamped] = 0
+
+    def _move_balls(self):
+        r = self.radius
+        x, y, xvel, yvel = self.ball_x, self.ball_y, self.ball_xvel, self.ball_yvel
+        x += xvel
+        y += yvel
+        # make sure you actually collide for a single frame before changing direction
+        wall = y <= r
+        y[wall] = r
+        np.negative(yvel, out=yvel, where=wall)
+        wall = y >= h - r
+        y[wall] = h - r
+        np.negative(yvel, out=yvel, where=wall)
+
+        # to prevent multiple collisions in a single axis in a single frame
+        x_cooldown, y_cooldown = self._x_cooldown, self._y_cooldown
+        x_cooldown[:] = False
+        y_cooldown[:] = False
+        for i in range(2):  # same order as box_obs in Ball.move, i.e. [left paddle, right paddle]
+            box_x = self.paddle_x[i]
+            box_y = self.paddle_y[:, i]
+            within_y = (box_y - r / 2 <= y) & (y <= box_y + self.paddle_height + r / 2)
+            within_x = (box_x - r <= x) & (x <= box_x + self.paddle_width + r)
+            # the four collisions are an if/elif chain in Ball.move, so each one excludes the ones before it
+            from_left = ~x_cooldown & (0 < box_x - x) & (box_x - x <= r) & within_y
+            from_right = (~x_cooldown & ~from_left & (0 < x - box_x - self.paddle_width)
+                          & (x - box_x - self.paddle_width <= r) & within_y)
+            face = from_left | from_right
+            from_above = ~face & ~y_cooldown & (0 < box_y - y) & (box_y - y <= r) & within_x
+            from_below = (~face & ~from_above & ~y_cooldown & (0 < y - box_y - self.paddle_height)
+                          & (y - box_y - self.paddle_height <= r) & within_x)
+            edge = from_above | from_below
+
+            x[from_left] = box_x - r
+            x[from_right] = box_x + self.paddle_width + r
+            np.negative(xvel, out=xvel, where=face)
+            np.copyto(yvel, np.clip(yvel + self.paddle_currvel[:, i], -self.softcap, self.softcap), where=face)
+            x_cooldown |= face
+            self.hits[:, i] = face
+
+            y[from_above] = box_y[from_above] - r
+            y[from_below] = box_y[from_below] + self.paddle_height + r
+            np.negative(yvel, out=yvel, where=edge)
+            y_cooldown |= edge
+
+        dead = self._dead
+        np.greater(x, w - 4, out=dead)
+        dead |= x < 4  # kill ball
+        return dead
+
+    def step(self, actions, auto_reset=True):
+        """
+        Advances every game by one frame.
+        :param actions: integer array of shape (n_games, 2) with the [left, right] action of each game
+                        (0 is up, 1 is stay, 2 is down)
+        :param auto_reset: if True, games in which a point was scored are reset straight away
+        :return: (dead, left_point) boolean arrays of shape (n_games,) - dead marks the games where a point was scored
+                 this frame and left_point marks the ones where it went to the left paddle (score2 in train_AI.py).
+                 Both arrays are reused on the next call, so copy them if they need to be kept.
+        """
+        actions = np.asarray(actions)
+        self._move_paddles(actions)
+        dead = self._move_balls()
+        left_point = dead & (self.ball_x > w // 2)
+        if auto_reset:
+            self.reset(dead)
+        return dead, left_point
+
+
+def check_parity(n_games=64, n_frames=5000, seed=0):
+    """
+    Runs BatchPong side by side with the original Paddle and Ball classes using random actions and raises an
+    AssertionError as soon as any ball or paddle differs between the two.
+    """
+    batch = BatchPong(n_games, seed=seed)
+    rng = np.random.default_rng(seed + 1)
+
+    def new_game(i):
+        # the batch picked the random starting velocities, so copy them over to the scalar ball
+        ball = Ball()
+        ball.xvel = int(batch.ball_xvel[i])
+        ball.yvel = int(batch.ball_yvel[i])
+        return [Paddle(8), Paddle(w - 24)], ball
+
+    games = [new_game(i) for i in range(n_games)]
+    for frame in range(n_frames):
+        actions = rng.integers(0, 3, size=(n_games, 2))
+        dead_balls = []
+        for i, (paddles, ball) in enumerate(games):
+            for paddle, action in zip(paddles, actions[i]):
+                paddle.currvel = 0
+                paddle.keys['up'] = action == 0
+                paddle.keys['down'] = action == 2
+                paddle.move()
+            dead_balls.append(ball.move(paddles))
+        dead, _ = batch.step(actions, auto_reset=False)
+
+        for i, (paddles, ball) in enumerate(games):
+            scalar = (ball.x, ball.y, ball.xvel, ball.yvel, bool(dead_balls[i]),
+                      paddles[0].y, paddles[1].y, paddles[0].currvel, paddles[1].currvel)
+            vector = (batch.ball_x[i], batch.ball_y[i], batch.ball_xvel[i], batch.ball_yvel[i], dead[i],
+                      batch.paddle_y[i, 0], batch.paddle_y[i, 1], batch.paddle_currvel[i, 0], batch.paddle_currvel[i, 1])
+            assert scalar == vector, "game {} differs on frame {}: {} != {}".format(i, frame, scalar, vector)
+
+        dead = dead.copy()
+        batch.reset(dead)
+        for i in np.flatnonzero(dead):
+            games[i] = new_game(i)
+
+
+if __name__ == "__main__":
+    check_parity()
+    print("BatchPong matches Paddle and Ball")
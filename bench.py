@@ -0,0 +1,222 @@
+###############################################################################################
+# Use this file to measure how fast each part of the training pipeline runs.
+# Every benchmark uses fixed seeds, and the results are written as JSON so that they can be
+# saved as a baseline and compared against later to catch performance regressions, e.g.
+#   python bench.py --output baseline.json
+#   python bench.py --baseline baseline.json
+###############################################################################################
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import numpy as np
+from game_env import Paddle, Ball, w
+from features import get_states, Featurizer
+from batch_env import BatchPong
+
+seed = 0
+
+
+def _rate(count, seconds):
+    return count / seconds if seconds else float('inf')
+
+
+def _random_game():
+    random.seed(seed)
+    return [Paddle(8), Paddle(w - 24)], Ball()
+
+
+def bench_env(frames):
+    """Frames per second of Paddle.move and Ball.move for a single game."""
+    paddles, ball = _random_game()
+    actions = np.random.default_rng(seed).integers(0, 3, size=(frames, 2)).tolist()
+    start = time.perf_counter()
+    for left, right in actions:
+        for paddle, action in zip(paddles, (left, right)):
+            paddle.currvel = 0
+            paddle.keys['up'] = action == 0
+            paddle.keys['down'] = action == 2
+            paddle.move()
+        if ball.move(paddles):
+            paddles, ball = [Paddle(8), Paddle(w - 24)], Ball()
+    return _rate(frames, time.perf_counter() - start)
+
+
+def bench_batch_env(frames, n_games=4096):
+    """Game frames per second of BatchPong, summed over all of its games."""
+    env = BatchPong(n_games, seed=seed)
+    actions = np.random.default_rng(seed).integers(0, 3, size=(16, n_games, 2))
+    steps = max(frames // n_games, 1)
+    start = time.perf_counter()
+    for i in range(steps):
+        env.step(actions[i % len(actions)])
+    return _rate(steps * n_games, time.perf_counter() - start)
+
+
+def bench_get_states(calls):
+    """Calls per second of get_states."""
+    paddles, ball = _random_game()
+    start = time.perf_counter()
+    for _ in range(calls):
+        get_states(paddles, ball)
+    return _rate(calls, time.perf_counter() - start)
+
+
+def bench_featurizer(calls):
+    """Calls per second of Featurizer.compute_objects, on the same game as bench_get_states."""
+    paddles, ball = _random_game()
+    featurizer = Featurizer()
+    out = np.zeros((2, 5), dtype=np.float32)
+    start = time.perf_counter()
+    for _ in range(calls):
+        featurizer.compute_objects(paddles, ball, out)
+    return _rate(calls, time.perf_counter() - start)
+
+
+def bench_batch_featurizer(calls, n_games=4096):
+    """Game states per second of Featurizer.compute over a BatchPong."""
+    env = BatchPong(n_games, seed=seed)
+    featurizer = Featurizer(n_games)
+    actions = np.ones((n_games, 2), dtype=np.int64)
+    steps = max(calls // n_games, 1)
+    elapsed = 0
+    for _ in range(steps):
+        start = time.perf_counter()
+        featurizer.compute(env.ball_x, env.ball_y, env.ball_xvel, env.ball_yvel, env.paddle_y)
+        elapsed += time.perf_counter() - start
+        env.step(actions)
+    return _rate(steps * n_games, elapsed)
+
+
+def _latencies(function, argument, calls):
+    function(argument)  # warm up, e.g. to trace tf.functions
+    times = np.empty(calls)
+    for i in range(calls):
+        start = time.perf_counter()
+        function(argument)
+        times[i] = time.perf_counter() - start
+    return times
+
+
+def bench_get_Q(calls):
+    """Latency percentiles of DQN.get_Q for a single state, in microseconds."""
+    from agents import DQN
+    agent = DQN(seed=seed)
+    states = np.random.default_rng(seed).random((calls, 5), dtype=np.float32)
+    times = _latencies(agent.get_Q, states[0], calls) * 1e6
+    return {'p50': float(np.percentile(times, 50)), 'p90': float(np.percentile(times, 90)),
+            'p99': float(np.percentile(times, 99))}
+
+
+def bench_update(transitions, replay_size=0):
+    """Transitions per second of DQN.update."""
+    from agents import DQN
+    agent = DQN(replay_size=replay_size, seed=seed)
+    rng = np.random.default_rng(seed)
+    states = rng.random((transitions + 1, 5), dtype=np.float32)
+    actions = rng.integers(0, 3, size=transitions)
+    rewards = rng.integers(-50, 100, size=transitions)
+    agent.update(states[0], states[1], actions[0], rewards[0])  # warm up
+    start = time.perf_counter()
+    for i in range(transitions):
+        agent.update(states[i], states[i + 1], actions[i], rewards[i])
+    return _rate(transitions, time.perf_counter() - start)
+
+
+def bench_training(frames, replay_size):
+    """Frames per second of headless self-play training, i.e. TrainingGame.play as train_AI.main runs it headless."""
+    from agents import DQN
+    from train_AI import TrainingGame
+    agent = DQN(replay_size=replay_size, seed=seed)
+    game = TrainingGame(seed=seed)
+    start = time.perf_counter()
+    game.play(agent, frames)
+    return _rate(frames, time.perf_counter() - start)
+
+
+def run(scale=1.0, only=None):
+    """
+    Runs the benchmarks and returns their results.
+    :param scale: multiplier for the number of iterations of every benchmark, lower is faster but noisier
+    :param only: names of the benchmarks to run, or None for all of them
+    :return: dict mapping benchmark name to {'value': ..., 'unit': ..., 'higher_is_better': ...}
+    """
+    def n(count):
+        return max(int(count * scale), 1)
+
+    results = {}
+
+    def record(name, unit, higher_is_better, function, *args):
+        if only and name not in only:
+            return
+        value = function(*args)
+        if isinstance(value, dict):  # percentiles, stored as one result each
+            for key, item in value.items():
+                results[name + '_' + key] = {'value': item, 'unit': unit, 'higher_is_better': higher_is_better}
+        else:
+            results[name] = {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+        print(name, value, unit, file=sys.stderr)
+
+    record('env', 'frames/s', True, bench_env, n(200000))
+    record('batch_env', 'frames/s', True, bench_batch_env, n(20000000))
+    record('get_states', 'calls/s', True, bench_get_states, n(200000))
+    record('featurizer', 'calls/s', True, bench_featurizer, n(200000))
+    record('batch_featurizer', 'states/s', True, bench_batch_featurizer, n(20000000))
+    # these create their DQN themselves, so tensorflow is only loaded if one of them is run
+    record('get_Q', 'us', False, bench_get_Q, n(2000))
+    record('update', 'transitions/s', True, bench_update, n(1000))
+    record('update_replay', 'transitions/s', True, bench_update, n(10000), 50000)
+    record('training', 'frames/s', True, bench_training, n(5000), 50000)
+    return results
+
+
+def compare(results, baseline, tolerance=0.1):
+    """
+    Compares results against a baseline from an earlier run.
+    :param tolerance: fraction a result may be worse than the baseline by before it counts as a regression
+    :return: list of (name, baseline value, new value) for every regression
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old, new = baseline[name]['value'], result['value']
+        if result['higher_is_better']:
+            worse = new < old * (1 - tolerance)
+        else:
+            worse = new > old * (1 + tolerance)
+        if worse:
+            regressions.append((name, old, new))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the environment, featurizer, inference and training.")
+    parser.add_argument("--output", help="file to write the results to as JSON (printed if not given)")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="fraction a result may be worse than the baseline by before failing")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier for the number of iterations")
+    parser.add_argument("--only", nargs="+", help="names of the benchmarks to run")
+    args = parser.parse_args()
+
+    report = {
+        'meta': {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+                 'seed': seed, 'scale': args.scale},
+        'results': run(args.scale, args.only),
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report['results'], json.load(f)['results'], args.tolerance)
+        for name, old, new in regressions:
+            print("Regression in", name + ":", old, "->", new, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
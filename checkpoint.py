@@ -0,0 +1,180 @@
+###############################################################################################
+# Saving and loading of training checkpoints.
+# A checkpoint is a single .npz file holding the network's weights, the optimizer's state and the
+# training progress (exploration rate, iterations, game number...), so a model can never end up
+# separated from its config. Saving copies everything in memory straight away and leaves the
+# slow part, writing to disk, to a background thread so that training doesn't have to wait.
+###############################################################################################
+import collections
+import json
+import os
+import queue
+import re
+import threading
+import numpy as np
+from agents import DQN
+
+checkpoint_pattern = re.compile(r'^game_(\d+)\.ckpt\.npz$')
+
+
+def snapshot(agent, game_num):
+    """
+    Copies everything needed to resume training into memory.
+    :return: dict of arrays to be saved with np.savez, including the metadata as a JSON string
+    """
+    arrays = {}
+    weights = agent.model.get_weights()  # alternating kernel and bias of each Dense layer, as in DQN.export
+    for i in range(len(weights) // 2):
+        arrays['kernel_' + str(i)] = weights[2 * i]
+        arrays['bias_' + str(i)] = weights[2 * i + 1]
+    optimizer_variables = agent.model.optimizer.variables
+    if callable(optimizer_variables):  # older versions of keras have variables() as a method
+        optimizer_variables = optimizer_variables()
+    for i, variable in enumerate(optimizer_variables):
+        arrays['optimizer_' + str(i)] = variable.numpy()
+    metadata = {
+        'game_num': game_num,
+        'exploration_rate': float(agent.exploration_rate),
+        'iterations': int(agent.iterations),
+        'learning_rate': float(agent.learning_rate),
+        'discount': float(agent.discount),
+        'layer_size': int(weights[0].shape[1]),
+        'steps': int(agent.steps),
+    }
+    arrays['metadata'] = np.array(json.dumps(metadata))
+    return arrays
+
+
+def write_checkpoint(filepath, arrays):
+    """
+    Writes a snapshot to filepath atomically: it is written to a temporary file first and then renamed, so filepath
+    either doesn't exist or holds a complete checkpoint, even if the process dies halfway through.
+    """
+    temporary = filepath + '.tmp'
+    with open(temporary, 'wb') as f:
+        np.savez(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, filepath)
+
+
+def list_checkpoints(directory):
+    """
+    :return: paths of the checkpoints in directory, from the oldest game to the newest
+    """
+    if not os.path.isdir(directory):
+        return []
+    found = []
+    for name in os.listdir(directory):
+        match = checkpoint_pattern.match(name)
+        if match:
+            found.append((int(match.group(1)), os.path.join(directory, name)))
+    return [path for _, path in sorted(found)]
+
+
+def latest_checkpoint(directory):
+    checkpoints = list_checkpoints(directory)
+    return checkpoints[-1] if checkpoints else None
+
+
+def read_checkpoint(filepath):
+    """
+    Reads a checkpoint without loading tensorflow.
+    :return: (weights, optimizer_variables, metadata) where weights is a list of alternating kernels and biases
+    """
+    with np.load(filepath) as data:
+        metadata = json.loads(str(data['metadata']))
+        weights = []
+        layer = 0
+        while 'kernel_' + str(layer) in data:
+            weights.extend([data['kernel_' + str(layer)], data['bias_' + str(layer)]])
+            layer += 1
+        optimizer_variables = []
+        while 'optimizer_' + str(len(optimizer_variables)) in data:
+            optimizer_variables.append(data['optimizer_' + str(len(optimizer_variables))])
+    return weights, optimizer_variables, metadata
+
+
+def load_checkpoint(filepath, **kwargs):
+    """
+    Recreates the DQN saved in a checkpoint, ready to continue training.
+    :param kwargs: extra arguments for DQN that aren't stored in checkpoints, e.g. replay_size
+    :return: (agent, metadata)
+    """
+    weights, optimizer_variables, metadata = read_checkpoint(filepath)
+    agent = DQN(learning_rate=metadata['learning_rate'], discount=metadata['discount'],
+                exploration_rate=metadata['exploration_rate'], iterations=metadata['iterations'],
+                layer_size=metadata['layer_size'], **kwargs)
+    agent.model.set_weights(weights)
+    if agent.target_model is not None:  # the target network isn't saved, it starts out as a copy
+        agent.sync_target()
+    agent.steps = metadata['steps']
+    optimizer = agent.model.optimizer
+    if optimizer_variables and hasattr(optimizer, 'build') and not getattr(optimizer, 'built', True):
+        optimizer.build(agent.model.trainable_variables)  # newer versions of keras only create the variables lazily
+    variables = optimizer.variables
+    if callable(variables):
+        variables = variables()
+    if len(variables) == len(optimizer_variables):
+        for variable, value in zip(variables, optimizer_variables):
+            variable.assign(value)
+    return agent, metadata
+
+
+class Checkpointer:
+    """
+    Saves checkpoints from a background thread and only keeps the most recent few that it saved itself, so checkpoints
+    left in the same folder by earlier runs are never deleted.
+    """
+    def __init__(self, directory='checkpoints', keep=5):
+        """
+        :param directory: folder the checkpoints are saved in, created if needed
+        :param keep: number of most recent checkpoints to keep, older ones saved by this Checkpointer are deleted (None
+                     keeps all of them)
+        """
+        self.directory = directory
+        self.keep = keep
+        self._saved = collections.deque()  # checkpoints written by this Checkpointer, oldest first
+        os.makedirs(directory, exist_ok=True)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    def save(self, agent, game_num):
+        """
+        Takes a snapshot of agent right away and queues it to be written to disk.
+        :return: path the checkpoint will be written to
+        """
+        filepath = os.path.join(self.directory, 'game_' + str(game_num) + '.ckpt.npz')
+        self._queue.put((filepath, snapshot(agent, game_num)))
+        return filepath
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                filepath, arrays = item
+                write_checkpoint(filepath, arrays)
+                if filepath in self._saved:  # overwritten, e.g. when saving the same game twice
+                    self._saved.remove(filepath)
+                self._saved.append(filepath)
+                if self.keep:
+                    while len(self._saved) > self.keep:
+                        os.remove(self._saved.popleft())
+                print("Successfully saved", filepath)
+            except Exception as error:  # a failed save shouldn't stop training, or this thread
+                print("Could not save checkpoint:", error)
+            finally:
+                self._queue.task_done()
+
+    def wait(self):
+        """
+        Blocks until every queued checkpoint has been written.
+        """
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
@@ -0,0 +1,211 @@
+###############################################################################################
+# Use this file to train the Deep Q-Learning network on several CPU cores at once.
+# Each actor process plays its own headless TrainingGame (see train_AI.py) with a NumPy copy of
+# the network and streams its experiences through shared memory to a single learner process.
+# The learner runs the DQN, trains on everything the actors send it, and every so often publishes
+# its updated weights back to the actors. Only the learner ever loads tensorflow.
+# By default the learner takes a training step for every train_every experiences, like train_AI.py,
+# and the actors wait for it when it falls behind. So the experiences per second are capped by how
+# fast the learner trains, however many actors there are. More actors only help once the learner
+# does less work per experience: a larger --batch-size with a larger --train-every, or
+# --max-train-steps, which lets the actors run ahead at the cost of fewer training steps per
+# experience.
+###############################################################################################
+import argparse
+import multiprocessing as mp
+import time
+import numpy as np
+from agents import DQN, NumpyPolicy
+from train_AI import TrainingGame, max_rally_frames
+from checkpoint import Checkpointer
+
+# every experience is a single float32 row: state (5 values), action, reward, new state (5 values), and 1 if a game
+# finished with it (else 0)
+TRANSITION_WIDTH = 13
+
+
+def _unflatten(flat, shapes):
+    weights = []
+    start = 0
+    for shape in shapes:
+        size = int(np.prod(shape))
+        weights.append(flat[start:start + size].reshape(shape))
+        start += size
+    return weights
+
+
+def _write_transition(row, state, action, reward, new_state, game_over=0):
+    row[:5] = state
+    row[5] = action
+    row[6] = reward
+    row[7:12] = new_state
+    row[12] = game_over
+
+
+def run_actor(actor_id, ring, ring_size, write_count, read_count, weights, weight_shapes, weights_version,
+              exploration_rate, weight_lock, games, stop, max_rally_frames=max_rally_frames, sync_every=100, seed=0):
+    """
+    Plays a headless game with the latest published weights and writes every experience into this actor's ring of
+    shared memory. Runs in its own process until stop is set.
+    :param ring: shared float32 array of ring_size * TRANSITION_WIDTH values, written to by this actor only
+    :param write_count: shared counter of experiences written so far, the learner reads everything up to it
+    :param read_count: shared counter of experiences the learner has read so far. The actor waits for the learner
+                       instead of overwriting rows it hasn't read yet, so no experience is ever lost
+    :param weights: shared float32 array holding the flattened weights published by the learner
+    :param games: shared counter of games the learner has trained on, so that rewards change with overall progress
+    :param sync_every: number of frames between checks for newly published weights
+    """
+    ring = np.frombuffer(ring, dtype=np.float32).reshape(ring_size, TRANSITION_WIDTH)
+    flat_weights = np.frombuffer(weights, dtype=np.float32)
+    with weight_lock:
+        policy = NumpyPolicy(_unflatten(flat_weights, weight_shapes), exploration_rate=exploration_rate.value,
+                             seed=seed + actor_id)
+        version = weights_version.value
+
+    game = TrainingGame(games.value + 1, max_rally_frames, seed=seed + actor_id)  # different serves in every actor
+    count = 0
+    frame = 0
+    while not stop.is_set():
+        frame += 1
+        if frame % sync_every == 0:
+            policy.exploration_rate = exploration_rate.value
+            if weights_version.value != version:
+                with weight_lock:
+                    policy.set_weights(_unflatten(flat_weights, weight_shapes))
+                    version = weights_version.value
+
+        state_left, state_right = states = game.get_states()
+        left_choice, right_choice = policy.get_next_actions(states)
+        game_num = game.game_num
+        new_state_left, new_state_right, reward2, reward1, event = game.step(left_choice, right_choice)
+
+        while count + 2 - read_count.value > ring_size and not stop.is_set():  # the ring is full, wait for the learner
+            time.sleep(0.0005)
+        _write_transition(ring[count % ring_size], state_left, left_choice, reward2, new_state_left)
+        game_over = game.game_num != game_num
+        _write_transition(ring[(count + 1) % ring_size], state_right, right_choice, reward1, new_state_right,
+                          game_over)
+        count += 2
+        with write_count.get_lock():  # the lock makes sure the rows are written before the learner sees the count
+            write_count.value = count
+
+        if game_over:  # the next game is numbered by the games the learner has seen, across all actors
+            game.game_num = games.value + 1
+
+
+def main(actors=4, max_rally_frames=max_rally_frames, replay_size=50000, batch_size=32, train_every=4,
+         prioritized=False, ring_size=65536, publish_every=50, max_frames=None, seed=0, checkpoint_dir='checkpoints',
+         keep_checkpoints=5, max_train_steps=None):
+    """
+    Starts the actors and runs the learner in this process until interrupted (or until max_frames experiences have
+    been trained on).
+    :param actors: number of actor processes, ideally one per spare CPU core
+    :param ring_size: number of experiences each actor can get ahead of the learner before it has to wait for it
+    :param publish_every: number of training steps between publishing the weights to the actors
+    :param max_frames: stop after this many experiences, or never if None
+    :param seed: base seed for the actors' games and random moves
+    :param checkpoint_dir: folder that a checkpoint is saved to every 10 games (across all actors)
+    :param keep_checkpoints: number of most recent checkpoints to keep
+    :param max_train_steps: most training steps the learner takes for every batch of experiences it collects from the
+                            actors, or None for one every train_every experiences (see DQN.update_batch)
+    """
+    ctx = mp.get_context("spawn")  # actors start fresh instead of inheriting the learner's tensorflow state
+    agent = DQN(replay_size=replay_size, batch_size=batch_size, train_every=train_every, prioritized=prioritized)
+    weight_shapes = [weight.shape for weight in agent.model.get_weights()]
+    weights = ctx.RawArray('f', sum(int(np.prod(shape)) for shape in weight_shapes))
+    flat_weights = np.frombuffer(weights, dtype=np.float32)
+    weights_version = ctx.RawValue('q', 0)
+    exploration_rate = ctx.RawValue('d', agent.exploration_rate)
+    weight_lock = ctx.Lock()
+    games = ctx.Value('q', 0)
+    stop = ctx.Event()
+
+    def publish():
+        with weight_lock:
+            flat_weights[:] = np.concatenate([weight.ravel() for weight in agent.model.get_weights()])
+            weights_version.value += 1
+        exploration_rate.value = agent.exploration_rate
+
+    publish()
+    rings, write_counts, read_counts, processes = [], [], [], []
+    for actor_id in range(actors):
+        rings.append(ctx.RawArray('f', ring_size * TRANSITION_WIDTH))
+        write_counts.append(ctx.Value('q', 0))
+        read_counts.append(ctx.RawValue('q', 0))  # only written by the learner
+        process = ctx.Process(target=run_actor, daemon=True,
+                              args=(actor_id, rings[-1], ring_size, write_counts[-1], read_counts[-1], weights,
+                                    weight_shapes, weights_version, exploration_rate, weight_lock, games, stop,
+                                    max_rally_frames),
+                              kwargs={'seed': seed})
+        process.start()
+        processes.append(process)
+    rings = [np.frombuffer(ring, dtype=np.float32).reshape(ring_size, TRANSITION_WIDTH) for ring in rings]
+
+    frames = 0
+    published_at = agent.train_steps
+    saved_games = 0
+    checkpointer = Checkpointer(checkpoint_dir, keep=keep_checkpoints)
+    try:
+        while max_frames is None or frames < max_frames:
+            for actor_id, process in enumerate(processes):
+                if process.exitcode is not None:  # otherwise the learner would wait for its experiences forever
+                    raise RuntimeError("actor " + str(actor_id) + " exited with code " + str(process.exitcode))
+            new_rows = []
+            for i in range(actors):
+                count = write_counts[i].value
+                start = read_counts[i].value
+                if count > start:
+                    new_rows.append(rings[i][np.arange(start, count) % ring_size])  # copies the rows
+                    read_counts[i].value = count  # lets the actor reuse them
+            if not new_rows:
+                time.sleep(0.001)
+                continue
+            rows = np.concatenate(new_rows)
+            agent.update_batch(rows[:, :5], rows[:, 7:12], rows[:, 5].astype(np.int32), rows[:, 6], max_train_steps)
+            frames += len(rows)
+            # games are only counted once they are trained on, so the rewards and checkpoints follow the learner
+            finished = int(np.count_nonzero(rows[:, 12]))
+            if finished:
+                with games.get_lock():
+                    games.value += finished
+
+            if agent.train_steps - published_at >= publish_every:
+                publish()
+                published_at = agent.train_steps
+            if games.value // 10 > saved_games:  # saves the model every 10 games, across all actors
+                saved_games = games.value // 10
+                checkpointer.save(agent, saved_games * 10)
+    finally:
+        stop.set()
+        for process in processes:
+            process.join()
+        checkpointer.close()
+    return agent
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the Deep Q-Learning network with parallel actor processes.")
+    parser.add_argument("--actors", type=int, default=max(mp.cpu_count() - 1, 1),
+                        help="number of actor processes playing games")
+    parser.add_argument("--max-rally-frames", type=int, default=max_rally_frames,
+                        help="frames without a point before a rally is declared an infinite loop")
+    parser.add_argument("--replay-size", type=int, default=50000, help="experiences remembered for experience replay")
+    parser.add_argument("--batch-size", type=int, default=32, help="experiences trained on at a time")
+    parser.add_argument("--train-every", type=int, default=4, help="experiences collected between training steps")
+    parser.add_argument("--prioritized", action="store_true", help="replay experiences with a larger error more often")
+    parser.add_argument("--ring-size", type=int, default=65536,
+                        help="experiences each actor can get ahead of the learner before waiting for it")
+    parser.add_argument("--publish-every", type=int, default=50,
+                        help="training steps between sending new weights to the actors")
+    parser.add_argument("--max-train-steps", type=int, default=None,
+                        help="most training steps per batch of experiences collected from the actors")
+    parser.add_argument("--max-frames", type=int, default=None, help="stop after this many experiences")
+    parser.add_argument("--seed", type=int, default=0, help="base seed for the actors")
+    parser.add_argument("--checkpoint-dir", default="checkpoints", help="folder to save a checkpoint to every 10 games")
+    parser.add_argument("--keep-checkpoints", type=int, default=5, help="number of most recent checkpoints to keep")
+    args = parser.parse_args()
+    main(actors=args.actors, max_rally_frames=args.max_rally_frames, replay_size=args.replay_size,
+         batch_size=args.batch_size, train_every=args.train_every, prioritized=args.prioritized,
+         ring_size=args.ring_size, publish_every=args.publish_every, max_frames=args.max_frames, seed=args.seed,
+         checkpoint_dir=args.checkpoint_dir, keep_checkpoints=args.keep_checkpoints,
+         max_train_steps=args.max_train_steps)
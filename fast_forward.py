@@ -0,0 +1,166 @@
+###############################################################################################
+# Event-driven simulation for when both paddles keep doing the same thing for a while, e.g. with
+# action repeat or scripted opponents.
+# Between bounces the ball just moves in a straight line, so instead of stepping every frame this
+# works out how many frames it will take before anything could happen (a wall bounce, reaching a
+# paddle, or leaving the field), jumps straight there, and only steps that one frame normally.
+# The results are exactly the same as stepping frame by frame; run this file to check.
+###############################################################################################
+import copy
+import random
+from game_env import Paddle, Ball, w, h
+
+never = float('inf')
+
+
+def _ceil_div(a, b):
+    return -(-a // b)
+
+
+def frames_until_within(position, velocity, low, high):
+    """
+    Returns the first frame k >= 1 where position + k * velocity is between low and high (inclusive), or never.
+    """
+    if velocity > 0:
+        k = max(1, _ceil_div(low - position, velocity))
+        return k if position + k * velocity <= high else never
+    if velocity < 0:
+        k = max(1, _ceil_div(position - high, -velocity))
+        return k if position + k * velocity >= low else never
+    return 1 if low <= position <= high else never
+
+
+def frames_until_contact(paddles, ball):
+    """
+    Returns the first frame (counting the next one as 1) in which Ball.move could do anything other than move the ball
+    in a straight line. All of the frames before it are guaranteed to be plain movement.
+    """
+    r = ball.radius
+    frames = never
+    # wall bounces
+    if ball.yvel > 0:
+        frames = max(1, _ceil_div(h - r - ball.y, ball.yvel))
+    elif ball.yvel < 0:
+        frames = max(1, _ceil_div(ball.y - r, -ball.yvel))
+    elif ball.y <= r or ball.y >= h - r:
+        frames = 1
+    # every kind of paddle collision needs the ball to be within this horizontal band around the paddle
+    for box in paddles:
+        frames = min(frames, frames_until_within(ball.x, ball.xvel, box.x - r, box.x + box.width + r))
+    # leaving the field
+    if ball.xvel > 0:
+        frames = min(frames, (w - 4 - ball.x) // ball.xvel + 1)
+    elif ball.xvel < 0:
+        frames = min(frames, (ball.x - 4) // -ball.xvel + 1)
+    return max(frames, 1)
+
+
+def _set_keys(paddle, action):
+    paddle.currvel = 0
+    paddle.keys['up'] = action == 0
+    paddle.keys['down'] = action == 2
+
+
+def advance_paddle(paddle, action, frames):
+    """
+    Moves a paddle as if it had been given the same action (0 is up, 1 is stay, 2 is down) for frames frames in a row,
+    without stepping through them. currvel ends up as it would be after the last of those frames.
+    """
+    _set_keys(paddle, action)
+    if frames <= 0 or action == 1:
+        return
+    if action == 0:
+        if paddle.y <= 0:
+            return
+        frames_to_edge = _ceil_div(paddle.y, paddle.vel)
+        if frames < frames_to_edge:
+            paddle.y -= frames * paddle.vel
+            paddle.currvel = -2
+        elif frames == frames_to_edge and paddle.y - frames * paddle.vel == 0:
+            paddle.y = 0
+            paddle.currvel = -2  # landed exactly on the edge during the last frame
+        else:
+            paddle.y = 0  # either overshot and got clamped on the last frame, or was already stuck at the edge
+    else:
+        bottom = h - paddle.height
+        if paddle.y >= bottom:
+            return
+        frames_to_edge = _ceil_div(bottom - paddle.y, paddle.vel)
+        if frames < frames_to_edge:
+            paddle.y += frames * paddle.vel
+            paddle.currvel = 2
+        elif frames == frames_to_edge and paddle.y + frames * paddle.vel == bottom:
+            paddle.y = bottom
+            paddle.currvel = 2
+        else:
+            paddle.y = bottom
+
+
+def fast_forward(paddles, ball, left_action, right_action, max_frames):
+    """
+    Plays up to max_frames frames with both paddles' actions held fixed, stopping as soon as a point is scored.
+    Equivalent to setting the keys, moving both paddles and calling ball.move once per frame.
+    :param paddles: [left, right] paddles, updated in place along with ball
+    :return: (frames, dead_ball, bounces) - the number of frames played, 1 if a point was scored on the last of them
+             (else 0), and the number of times the ball was hit back by a paddle
+    """
+    frames = 0
+    bounces = 0
+    actions = (left_action, right_action)
+    while frames < max_frames:
+        skip = min(frames_until_contact(paddles, ball), max_frames - frames) - 1
+        if skip:
+            ball.x += skip * ball.xvel
+            ball.y += skip * ball.yvel
+            for paddle, action in zip(paddles, actions):
+                advance_paddle(paddle, action, skip)
+        # the frame where something might happen is stepped normally
+        for paddle, action in zip(paddles, actions):
+            _set_keys(paddle, action)
+            paddle.move()
+        xvel = ball.xvel
+        dead_ball = ball.move(paddles)
+        bounces += ball.xvel != xvel
+        frames += skip + 1
+        if dead_ball:
+            return frames, 1, bounces
+    return frames, 0, bounces
+
+
+def check_parity(rallies=2000, seed=0):
+    """
+    Plays random rallies with randomly held actions both with fast_forward and frame by frame, and raises an
+    AssertionError if the two ever end up in a different state.
+    """
+    rng = random.Random(seed)
+    random.seed(seed)
+    for rally in range(rallies):
+        paddles, ball = [Paddle(8), Paddle(w - 24)], Ball()
+        dead_ball = 0
+        while not dead_ball:
+            left_action, right_action = rng.randrange(3), rng.randrange(3)
+            hold = rng.choice([1, 2, 5, 20, 100, 1000])
+            expected_paddles, expected_ball = copy.deepcopy(paddles), copy.deepcopy(ball)
+            expected_frames, expected_bounces = 0, 0
+            while expected_frames < hold:
+                for paddle, action in zip(expected_paddles, (left_action, right_action)):
+                    _set_keys(paddle, action)
+                    paddle.move()
+                xvel = expected_ball.xvel
+                dead_ball = expected_ball.move(expected_paddles)
+                expected_bounces += expected_ball.xvel != xvel
+                expected_frames += 1
+                if dead_ball:
+                    break
+            result = fast_forward(paddles, ball, left_action, right_action, hold)
+
+            def state(paddles, ball):
+                return [(p.y, p.currvel) for p in paddles] + [ball.x, ball.y, ball.xvel, ball.yvel]
+            assert result == (expected_frames, dead_ball, expected_bounces), (rally, result, expected_frames)
+            assert state(paddles, ball) == state(expected_paddles, expected_ball), \
+                (rally, state(paddles, ball), state(expected_paddles, expected_ball))
+
+
+if __name__ == "__main__":
+    check_parity()
+    print("fast_forward matches frame by frame stepping")
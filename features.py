@@ -0,0 +1,220 @@
+###############################################################################################
+# Turns the positions of the ball and paddles into the states that the DQN takes as inputs.
+# get_states is the original, straightforward version. Featurizer computes exactly the same
+# values, but writes them into preallocated float32 arrays, works on whole batches of games
+# (e.g. from batch_env.BatchPong), and when batched only redoes the trajectory prediction
+# after a bounce.
+###############################################################################################
+import struct
+import numpy as np
+from game_env import w, h
+
+# x of the faces of the left and right paddles, which never move sideways
+left_face = 8 + 16
+right_face = w - 24
+radius = 8  # of the ball
+paddle_height = 80
+softcap = 8
+# horizontal distance the ball travels between the two paddles, used to predict where it reaches the far side
+court_length = w - 2 * (left_face + radius)
+# x of the ball when it touches the face of the left or right paddle
+left_edge = left_face + radius
+right_edge = right_face - radius
+lowest_paddle_y = h - paddle_height  # y of a paddle at the bottom of the screen
+half_paddle = paddle_height // 2
+# the 10 float32 values of the [left, right] states, for writing them straight into an array's memory
+_pack_state = struct.Struct('=10f')
+_float32 = np.dtype(np.float32)
+
+
+def get_states(paddles, ball):
+    """
+    Returns the state of the game from each paddle's perspective to be used as inputs for the DQN
+    Inputs for DQN (i.e. state, all inputs will be normalized):
+    >> recommended direction
+    >> y of opponent's middle
+    >> predicted y of ball when it reaches opponent
+    >> relative x distance of ball from agent
+    >> yvel of ball
+    """
+    relx_left = ball.x - ball.radius - (paddles[0].x + paddles[0].width)
+    relx_right = paddles[1].x - (ball.x + ball.radius)
+    # predicting where the ball would hit on left and right sides, assuming no spin is applied
+    if ball.xvel < 0:
+        pred_left = ball.y + ball.yvel * relx_left // abs(ball.xvel)
+        mod = 1
+        if pred_left < 0:
+            pred_left = -pred_left
+            mod = -1
+        elif pred_left > h:
+            pred_left = -pred_left + 2 * h
+            mod = -1
+        pred_right = pred_left + mod * ball.yvel * (w - 2 * (paddles[0].x + paddles[0].width + ball.radius)) // abs(
+            ball.xvel)
+        if pred_right < 0:
+            pred_right = -pred_right
+        elif pred_right > h:
+            pred_right = -pred_right + 2 * h
+    else:
+        pred_right = ball.y + ball.yvel * relx_right // abs(ball.xvel)
+        mod = 1
+        if pred_right < 0:
+            pred_right = -pred_right
+            mod = -1
+        elif pred_right > h:
+            pred_right = -pred_right + 2 * h
+            mod = -1
+        pred_left = pred_right + mod * ball.yvel * (w - 2 * (paddles[0].x + paddles[0].width + ball.radius)) // abs(
+            ball.xvel)
+        if pred_left < 0:
+            pred_left = -pred_left
+        elif pred_left > h:
+            pred_left = -pred_left + 2 * h
+    if pred_left > (paddles[0].y + paddles[0].height // 2) and paddles[0].y + paddles[0].height != h:
+        rec_left = 1  # recommended to move down
+    elif pred_left < (paddles[0].y + paddles[0].height // 2) and paddles[0].y != 0:
+        rec_left = -1  # recommeded to move up
+    else:
+        rec_left = 0
+    if pred_right > (paddles[1].y + paddles[1].height // 2) and paddles[1].y + paddles[1].height != h:
+        rec_right = 1  # recommended to move down
+    elif pred_right < (paddles[1].y + paddles[1].height // 2) and paddles[1].y != 0:
+        rec_right = -1  # recommeded to move up
+    else:
+        rec_right = 0
+    # input states for left and right agents
+    state_left = [rec_left, (paddles[1].y + paddles[1].height // 2) / h,
+                  pred_right / h, relx_left / w, ball.yvel / ball.softcap]
+    state_right = [rec_right, (paddles[0].y + paddles[0].height // 2) / h,
+                   pred_left / h, relx_right / w, ball.yvel / ball.softcap]
+    return state_left, state_right
+
+
+class Featurizer:
+    """
+    Computes the same states as get_states, either for a single game from its Paddle and Ball objects
+    (compute_objects) or for a whole batch of games from arrays (compute).
+
+    The predicted y of the ball when it reaches each paddle doesn't change while the ball travels in a straight line:
+    every frame x moves by xvel and y by yvel, which shifts both terms of the prediction by exactly the same amount.
+    So compute caches the predictions along with the ball's position and velocity, and only recalculates them when
+    the ball is no longer on the same line at the same speed, i.e. after a wall or paddle bounce or a reset.
+    """
+    def __init__(self, n_games=1):
+        """
+        :param n_games: number of games passed to compute at a time
+        """
+        self.n_games = n_games
+        self.out = np.zeros((n_games, 2, 5), dtype=np.float32)  # used when compute isn't given an output array
+        # cache for compute, one row per game
+        self.pred = np.zeros((n_games, 2), dtype=np.int64)  # [pred_left, pred_right] for each game
+        self._ball = np.zeros((4, n_games), dtype=np.int64)  # x, y, xvel and yvel the predictions were made for
+        self._cached = np.zeros(n_games, dtype=bool)
+        # predictions of the last call to compute_objects
+        self.pred_left, self.pred_right = 0, 0
+
+    def compute_objects(self, paddles, ball, out=None):
+        """
+        Same as get_states, for a single game. Unlike compute this doesn't cache the predictions, since for a single
+        game checking the cache costs as much as the few integer operations it would save.
+        :param paddles: [left, right] Paddle objects
+        :param out: float32 array of shape (2, 5) to write the states to, the rows are the left and right states
+        :return: out
+        """
+        if out is None:
+            out = self.out[0]
+        x, y, xvel, yvel = ball.x, ball.y, ball.xvel, ball.yvel
+        speed = abs(xvel)
+        relx_left = x - left_edge
+        relx_right = right_edge - x
+        first = y + yvel * (relx_left if xvel < 0 else relx_right) // speed
+        mod = 1
+        if first < 0:
+            first = -first
+            mod = -1
+        elif first > h:
+            first = -first + 2 * h
+            mod = -1
+        second = first + mod * yvel * court_length // speed
+        if second < 0:
+            second = -second
+        elif second > h:
+            second = -second + 2 * h
+        if xvel < 0:
+            self.pred_left = pred_left = first
+            self.pred_right = pred_right = second
+        else:
+            self.pred_left = pred_left = second
+            self.pred_right = pred_right = first
+
+        left_y, right_y = paddles[0].y, paddles[1].y
+        left_mid = left_y + half_paddle
+        right_mid = right_y + half_paddle
+        if pred_left > left_mid and left_y != lowest_paddle_y:
+            rec_left = 1  # recommended to move down
+        elif pred_left < left_mid and left_y != 0:
+            rec_left = -1  # recommended to move up
+        else:
+            rec_left = 0
+        if pred_right > right_mid and right_y != lowest_paddle_y:
+            rec_right = 1
+        elif pred_right < right_mid and right_y != 0:
+            rec_right = -1
+        else:
+            rec_right = 0
+        yvel_input = yvel / softcap
+        if out.dtype is _float32 and out.flags.c_contiguous:
+            # writing the values straight into out's memory is much quicker than assigning them through numpy
+            _pack_state.pack_into(out, 0, rec_left, right_mid / h, pred_right / h, relx_left / w, yvel_input,
+                                  rec_right, left_mid / h, pred_left / h, relx_right / w, yvel_input)
+        else:
+            out[...] = ((rec_left, right_mid / h, pred_right / h, relx_left / w, yvel_input),
+                        (rec_right, left_mid / h, pred_left / h, relx_right / w, yvel_input))
+        return out
+
+    def compute(self, ball_x, ball_y, ball_xvel, ball_yvel, paddle_y, out=None):
+        """
+        Same as get_states, for a whole batch of games at once.
+        :param ball_x, ball_y, ball_xvel, ball_yvel: integer arrays of shape (n_games,)
+        :param paddle_y: integer array of shape (n_games, 2) with the y of the [left, right] paddles
+        :param out: float32 array of shape (n_games, 2, 5) to write the states to; out[:, 0] are the left states and
+                    out[:, 1] the right ones, and out.reshape(-1, 5) can be passed straight to get_next_actions
+        :return: out
+        """
+        if out is None:
+            out = self.out
+        cached_x, cached_y, cached_xvel, cached_yvel = self._ball
+        dx = ball_x - cached_x
+        stale = ~(self._cached & (ball_xvel == cached_xvel) & (ball_yvel == cached_yvel) & (dx % ball_xvel == 0)
+                  & (ball_y - cached_y == dx // ball_xvel * ball_yvel))
+        if stale.any():
+            x, y, xvel, yvel = ball_x[stale], ball_y[stale], ball_xvel[stale], ball_yvel[stale]
+            speed = np.abs(xvel)
+            towards_left = xvel < 0
+            relx = np.where(towards_left, x - radius - left_face, right_face - (x + radius))
+            first = y + yvel * relx // speed
+            bounced = (first < 0) | (first > h)
+            first = np.where(first < 0, -first, np.where(first > h, 2 * h - first, first))
+            second = first + np.where(bounced, -1, 1) * yvel * court_length // speed
+            second = np.where(second < 0, -second, np.where(second > h, 2 * h - second, second))
+            self.pred[stale, 0] = np.where(towards_left, first, second)
+            self.pred[stale, 1] = np.where(towards_left, second, first)
+            self._ball[:, stale] = (x, y, xvel, yvel)
+            self._cached[stale] = True
+
+        mid = paddle_y + paddle_height // 2
+        rec = np.where((self.pred > mid) & (paddle_y + paddle_height != h), 1,
+                       np.where((self.pred < mid) & (paddle_y != 0), -1, 0))
+        yvel_input = ball_yvel / softcap
+        left, right = out[:, 0], out[:, 1]
+        left[:, 0] = rec[:, 0]
+        left[:, 1] = mid[:, 1] / h
+        left[:, 2] = self.pred[:, 1] / h
+        left[:, 3] = (ball_x - radius - left_face) / w
+        left[:, 4] = yvel_input
+        right[:, 0] = rec[:, 1]
+        right[:, 1] = mid[:, 0] / h
+        right[:, 2] = self.pred[:, 0] / h
+        right[:, 3] = (right_face - (ball_x + radius)) / w
+        right[:, 4] = yvel_input
+        return out
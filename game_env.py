@@ -33,12 +33,14 @@ class Paddle:
                 self.currvel = 0
 
 class Ball:
-    def __init__(self):
+    def __init__(self, rng=None):
+        # rng can be a seeded random.Random to make the starting direction reproducible
+        rng = rng or random
         self.radius = 8
         self.x = w // 2
         self.y = h // 2
-        self.xvel = random.choice([-6, 6])
-        self.yvel = random.randrange(-4, 5, 2)
+        self.xvel = rng.choice([-6, 6])
+        self.yvel = rng.randrange(-4, 5, 2)
         self.softcap = 8
 
     def move(self, box_obs):
@@ -91,7 +93,20 @@ class Ball:
             return 1
         return 0
 
-def draw_window(win, paddles, ball, score2, score1, indicator=False, font=pygame.font.SysFont("comicsans", 30), game_num=0):
+_font = None
+
+
+def _default_font():
+    # created on first use rather than as a default argument, which would need the font module as soon as this file
+    # is imported
+    global _font
+    if _font is None:
+        _font = pygame.font.SysFont("comicsans", 30)
+    return _font
+
+
+def draw_window(win, paddles, ball, score2, score1, indicator=False, font=None, game_num=0):
+    font = font or _default_font()
     win.fill((0, 0, 0))
     for i in range(h//20):
         pygame.draw.rect(win, (127, 127, 127), ((w - 10)//2, (i * h//20) + 3, 10, h//20 - 6))
@@ -108,13 +123,88 @@ def draw_window(win, paddles, ball, score2, score1, indicator=False, font=pygame
     if game_num:
         game_label = font.render("Game:" + str(game_num), 1, (255, 255, 255))
         win.blit(game_label, ((w - game_label.get_width()) // 2, 10))
-        pygame.display.update()
     pygame.display.update()
 
+
+class Renderer:
+    """
+    Draws exactly what draw_window does, but much more cheaply:
+    >> the background and center line are drawn once and kept on a separate surface
+    >> the score and game number labels are only rendered again when their values change
+    >> only the parts of the screen that changed since the last frame are redrawn and sent to the display
+    """
+    def __init__(self, win, font=None, render_every=1):
+        """
+        :param win: display surface to draw on
+        :param render_every: only draw one in this many frames (see tick), so that watching training doesn't slow it down
+        """
+        self.win = win
+        self.font = font or _default_font()
+        self.render_every = render_every
+        self.frame = 0
+        self.background = pygame.Surface((w, h))
+        self.background.fill((0, 0, 0))
+        for i in range(h//20):
+            pygame.draw.rect(self.background, (127, 127, 127), ((w - 10)//2, (i * h//20) + 3, 10, h//20 - 6))
+        self._labels = {}  # name -> (text, rendered surface)
+        self._drawn = []  # rects drawn on the last frame, which have to be erased on the next one
+        self._full_redraw = True
+
+    def tick(self):
+        """
+        Counts a frame.
+        :return: True if this frame should be drawn, i.e. once every render_every frames
+        """
+        self.frame += 1
+        return self.frame % self.render_every == 0
+
+    def invalidate(self):
+        """
+        Makes the next draw redraw the whole window, e.g. after something else was drawn on top of it.
+        """
+        self._full_redraw = True
+
+    def _label(self, name, text):
+        cached = self._labels.get(name)
+        if cached is None or cached[0] != text:
+            cached = (text, self.font.render(text, 1, (255, 255, 255)))
+            self._labels[name] = cached
+        return cached[1]
+
+    def draw(self, paddles, ball, score2, score1, indicator=False, game_num=0):
+        win = self.win
+        if self._full_redraw:
+            win.blit(self.background, (0, 0))
+        else:
+            for rect in self._drawn:  # erase everything that moved by drawing the background over it
+                win.blit(self.background, rect, rect)
+        drawn = []
+        for paddle in paddles:
+            drawn.append(pygame.draw.rect(win, (255, 255, 255), (paddle.x, paddle.y, paddle.width, paddle.height)))
+        drawn.append(pygame.draw.circle(win, (255, 255, 255), (ball.x, ball.y), ball.radius))
+        # the labels are redrawn every frame in case the ball passed over them, but only rendered when they change
+        score2_label = self._label('score2', str(score2))
+        drawn.append(win.blit(score2_label, (10, 10)))
+        score1_label = self._label('score1', str(score1))
+        drawn.append(win.blit(score1_label, (w - score1_label.get_width() - 10, 10)))
+        if indicator:
+            for i in range(2, 50, 2):
+                drawn.append(pygame.draw.circle(win, (255, 255, 255), (ball.x + i * ball.xvel, ball.y + i * ball.yvel), 2))
+        if game_num:
+            game_label = self._label('game', "Game:" + str(game_num))
+            drawn.append(win.blit(game_label, ((w - game_label.get_width()) // 2, 10)))
+
+        if self._full_redraw:
+            pygame.display.update()
+            self._full_redraw = False
+        else:
+            pygame.display.update(self._drawn + drawn)
+        self._drawn = drawn
+
+
 def main():
     win = pygame.display.set_mode((w, h))
     pygame.display.set_caption("Pong")
-    font = pygame.font.SysFont("comicsans", 30)
     win_font = pygame.font.SysFont("comicsans", 50)
     clock = pygame.time.Clock()
     running = True
@@ -122,7 +212,8 @@ def main():
     ball = Ball()
     dead_ball = 0
     score2, score1 = 0, 0
-    draw_window(win, paddles, ball, score2, score1, True)
+    renderer = Renderer(win)
+    renderer.draw(paddles, ball, score2, score1, True)
     pygame.time.delay(1000)
     while running:
         clock.tick(100)
@@ -164,17 +255,17 @@ def main():
                 score2 += 1
             else:
                 score1 += 1
-            draw_window(win, paddles, ball, score2, score1)
+            renderer.draw(paddles, ball, score2, score1)
             pygame.time.delay(1000)
             if score1 != 10 and score2 != 10:
                 del ball
                 del paddles[0:2]
                 paddles.extend([Paddle(8), Paddle(w - 24)])
                 ball = Ball()
-                draw_window(win, paddles, ball, score2, score1, True)
+                renderer.draw(paddles, ball, score2, score1, True)
                 pygame.time.delay(1000)
         else:
-            draw_window(win, paddles, ball, score2, score1)
+            renderer.draw(paddles, ball, score2, score1)
 
     pygame.quit()
 
@@ -0,0 +1,121 @@
+###############################################################################################
+# Lightweight instrumentation for the training loop.
+# Timings and per-rally stats are kept in memory and appended to CSV files in batches, so that
+# recording them costs next to nothing compared to printing to the terminal every frame.
+###############################################################################################
+import csv
+import time
+
+
+class MetricsLogger:
+    """
+    Records how long each phase of the training loop takes and a summary of every rally.
+
+    Phases are timed like laps of a stopwatch: start_frame starts it, and every call to lap(phase) adds the time since
+    the previous call to that phase. Only every sample_every-th frame is timed, the rest only cost a comparison.
+
+    Two CSV files are written:
+    >> filepath + '_timers.csv': average microseconds per frame spent in each phase, one row per timer_every timed frames
+    >> filepath + '_rallies.csv': one row per rally (until a point is scored or the rally is declared an infinite loop)
+    """
+    phases = ('featurization', 'inference', 'simulation', 'rendering', 'training')
+    rally_columns = ('frame', 'game_num', 'event', 'reward_left', 'reward_right', 'bounces', 'rally_frames',
+                     'exploration_rate', 'score_left', 'score_right')
+
+    def __init__(self, filepath='training_metrics', sample_every=10, timer_every=100, flush_every=100):
+        """
+        :param filepath: start of the names of the CSV files, which are appended to if they already exist
+        :param sample_every: time one in this many frames
+        :param timer_every: number of timed frames averaged into each row of the timers file
+        :param flush_every: number of buffered rows (of either file) that triggers writing them to disk
+        """
+        self.filepath = filepath
+        self.sample_every = sample_every
+        self.timer_every = timer_every
+        self.flush_every = flush_every
+        self.frame = 0
+        self._started = 0  # calls to start_frame
+        self._sampled = False
+        self._frame_count = 1  # simulated frames in the current one, more than 1 if add_frames was called
+        self._last = 0.0
+        self._totals = dict.fromkeys(self.phases, 0.0)
+        self._timed_frames = 0
+        self._reward_left, self._reward_right = 0, 0
+        self._timer_rows = []
+        self._rally_rows = []
+
+    def start_frame(self):
+        self.frame += 1
+        self._started += 1
+        self._sampled = self._started % self.sample_every == 0  # not frame, which add_frames can move by any amount
+        self._frame_count = 1
+        if self._sampled:
+            self._last = time.perf_counter()
+
+    def add_frames(self, count):
+        """
+        Counts count more frames as part of the current one, for frames played without a loop of their own (see
+        TrainingGame.skip), so that frame numbers and per-frame timings stay in simulated frames.
+        """
+        self.frame += count
+        self._frame_count += count
+
+    def lap(self, phase):
+        """
+        Adds the time since the last lap (or the start of the frame) to phase.
+        """
+        if self._sampled:
+            now = time.perf_counter()
+            self._totals[phase] += now - self._last
+            self._last = now
+
+    def end_frame(self):
+        if not self._sampled:
+            return
+        self._timed_frames += self._frame_count
+        if self._timed_frames >= self.timer_every:
+            self._timer_rows.append([self.frame] + [round(self._totals[phase] / self._timed_frames * 1e6, 1)
+                                                    for phase in self.phases])
+            self._totals = dict.fromkeys(self.phases, 0.0)
+            self._timed_frames = 0
+            self._maybe_flush()
+
+    def add_rewards(self, reward_left, reward_right):
+        self._reward_left += reward_left
+        self._reward_right += reward_right
+
+    def end_rally(self, game, event, exploration_rate):
+        """
+        Records a summary of the rally that just ended.
+        :param game: the TrainingGame the rally was played in, after its step returned event. The rally is logged with
+                     the game number and score it ended with, before a finished game reset them
+        :param event: "point" or "stall", as returned by TrainingGame.step
+        """
+        self._rally_rows.append((self.frame, game.last_rally_game_num, event, self._reward_left, self._reward_right,
+                                 game.last_rally_bounces, game.last_rally_frames, round(float(exploration_rate), 6),
+                                 game.last_rally_score2, game.last_rally_score1))
+        self._reward_left, self._reward_right = 0, 0
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if len(self._timer_rows) + len(self._rally_rows) >= self.flush_every:
+            self.flush()
+
+    @staticmethod
+    def _append(filepath, header, rows):
+        with open(filepath, 'a', newline='') as f:
+            writer = csv.writer(f)
+            if f.tell() == 0:  # new file
+                writer.writerow(header)
+            writer.writerows(rows)
+
+    def flush(self):
+        """
+        Writes all buffered rows to disk.
+        """
+        if self._timer_rows:
+            self._append(self.filepath + '_timers.csv', ('frame',) + self.phases, self._timer_rows)
+            self._timer_rows = []
+        if self._rally_rows:
+            self._append(self.filepath + '_rallies.csv', self.rally_columns, self._rally_rows)
+            self._rally_rows = []
@@ -0,0 +1,189 @@
+###############################################################################################
+# Use this file to train the Deep Q-Learning network on experiences recorded earlier with
+# train_AI.py --record, without playing any games, e.g.
+#   python offline.py recordings/*.trj --epochs 5 --output offline.ckpt.npz
+# The recordings are memory-mapped and read a block at a time, so they can be much larger than
+# RAM. Blocks are visited in a random order and shuffled together a few at a time, and a
+# background thread prepares the next batches while the network trains on the current one.
+###############################################################################################
+import argparse
+import queue
+import threading
+import time
+import numpy as np
+from trajectory import read_trajectory
+from checkpoint import snapshot, write_checkpoint, load_checkpoint
+
+
+class TrajectoryDataset:
+    """
+    Every experience in a set of trajectory files, served as shuffled batches.
+    """
+    def __init__(self, filepaths):
+        self.filepaths = list(filepaths)
+        self.records = []
+        state_size = None
+        for filepath in self.filepaths:
+            header, records = read_trajectory(filepath)
+            if state_size is None:
+                state_size = header['state_size']
+            elif header['state_size'] != state_size:
+                raise ValueError(filepath + " has a different state size than " + self.filepaths[0])
+            if len(records):
+                self.records.append(records)
+        self.state_size = state_size
+
+    def __len__(self):
+        return sum(len(records) for records in self.records)
+
+    def batches(self, batch_size, block_size=65536, shuffle_blocks=8, rng=None):
+        """
+        Goes through every experience once, in random batches. Only shuffle_blocks blocks of block_size experiences
+        are in memory at a time: the order of the blocks is random, and so is the order of the experiences within
+        every group of blocks that are loaded together.
+        :return: generator of (old_states, actions, rewards, new_states) batches. The last one may be smaller.
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        blocks = [(records, start) for records in self.records for start in range(0, len(records), block_size)]
+        order = rng.permutation(len(blocks))
+        leftover = None  # experiences that didn't fill a whole batch, carried over into the next group of blocks
+        for group in range(0, len(order), shuffle_blocks):
+            # slicing the memory map reads each block from disk in one go
+            parts = [np.array(blocks[i][0][blocks[i][1]:blocks[i][1] + block_size])
+                     for i in order[group:group + shuffle_blocks]]
+            if leftover is not None:
+                parts.append(leftover)
+            chunk = np.concatenate(parts)
+            chunk = chunk[rng.permutation(len(chunk))]
+            whole = len(chunk) - len(chunk) % batch_size
+            for start in range(0, whole, batch_size):
+                yield self._split(chunk[start:start + batch_size])
+            leftover = chunk[whole:]
+        if leftover is not None and len(leftover):
+            yield self._split(leftover)
+
+    @staticmethod
+    def _split(records):
+        return (np.ascontiguousarray(records['state']), records['action'].astype(np.int64),
+                records['reward'].astype(np.float32), np.ascontiguousarray(records['next_state']))
+
+
+class Prefetcher:
+    """
+    Runs a generator in a background thread, keeping up to depth of its items ready, so that reading and shuffling
+    the next batches overlaps with training on the current one.
+    """
+    _done = object()
+
+    def __init__(self, iterable, depth=4):
+        self._queue = queue.Queue(maxsize=depth)
+        self._error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._fill, args=(iterable,), daemon=True)
+        self._thread.start()
+
+    def _fill(self, iterable):
+        try:
+            for item in iterable:
+                while not self._stop.is_set():
+                    try:
+                        self._queue.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if self._stop.is_set():
+                    return
+        except Exception as error:  # raised again in the consuming thread
+            self._error = error
+        finally:
+            self._queue.put(self._done)
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is self._done:
+                if self._error is not None:
+                    raise self._error
+                return
+            yield item
+
+    def close(self):
+        self._stop.set()
+        while self._thread.is_alive():  # unblocks the thread if it is waiting for space in the queue
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                self._thread.join(0.01)
+
+
+def main(filepaths, epochs=1, batch_size=1024, learning_rate=0.5, discount=0.95, layer_size=32, resume=None,
+         output='offline.ckpt.npz', block_size=65536, shuffle_blocks=8, prefetch=4, seed=None, target_sync=0,
+         target_tau=1.0, double=False):
+    """
+    Trains a DQN on every experience in the given trajectory files, epochs times over.
+    :param batch_size: experiences per training step. Much larger than when training online, since the data is
+                       already there and larger batches make better use of every call into keras
+    :param resume: checkpoint to continue training from, instead of a new network
+    :param output: checkpoint file that the network is saved to after every epoch
+    :param block_size: number of consecutive experiences read from disk at a time
+    :param shuffle_blocks: number of blocks shuffled together, which sets how much memory the shuffling uses
+    :param prefetch: number of batches prepared ahead of training
+    :param seed: seed for the order of the experiences, to make runs reproducible
+    :param target_sync: training steps between syncs of a target network (see DQN), 0 for no target network
+    :return: the trained agent
+    """
+    dataset = TrajectoryDataset(filepaths)
+    if not len(dataset):
+        raise ValueError("no experiences found in " + ", ".join(dataset.filepaths))
+    game_num = 0
+    if resume:
+        agent, metadata = load_checkpoint(resume, seed=seed, target_sync=target_sync, target_tau=target_tau,
+                                          double=double)
+        game_num = metadata['game_num']
+    else:
+        from agents import DQN
+        agent = DQN(learning_rate=learning_rate, discount=discount, exploration_rate=0.0, iterations=0,
+                    layer_size=layer_size, seed=seed, target_sync=target_sync, target_tau=target_tau, double=double)
+    rng = np.random.default_rng(seed)
+    for epoch in range(1, epochs + 1):
+        start = time.perf_counter()
+        batches = Prefetcher(dataset.batches(batch_size, block_size, shuffle_blocks, rng), depth=prefetch)
+        error, count = 0.0, 0
+        try:
+            for old_states, actions, rewards, new_states in batches:
+                td_errors = agent.train_batch(old_states, actions, rewards, new_states)
+                error += float(np.abs(td_errors).sum())
+                count += len(actions)
+        finally:
+            batches.close()
+        elapsed = time.perf_counter() - start
+        print("Epoch", epoch, "- mean absolute TD error:", round(error / count, 4),
+              "-", int(count / elapsed), "experiences/s")
+        write_checkpoint(output, snapshot(agent, game_num))
+    return agent
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the Deep Q-Learning network on recorded experiences.")
+    parser.add_argument("trajectories", nargs="+", help="trajectory files recorded with train_AI.py --record")
+    parser.add_argument("--epochs", type=int, default=1, help="number of times to go through every experience")
+    parser.add_argument("--batch-size", type=int, default=1024, help="experiences trained on at a time")
+    parser.add_argument("--learning-rate", type=float, default=0.5)
+    parser.add_argument("--discount", type=float, default=0.95)
+    parser.add_argument("--layer-size", type=int, default=32, help="neurons in each hidden layer")
+    parser.add_argument("--resume", default=None, help="checkpoint to continue training from")
+    parser.add_argument("--output", default="offline.ckpt.npz", help="checkpoint to save to after every epoch")
+    parser.add_argument("--block-size", type=int, default=65536, help="experiences read from disk at a time")
+    parser.add_argument("--shuffle-blocks", type=int, default=8, help="blocks shuffled together in memory")
+    parser.add_argument("--prefetch", type=int, default=4, help="batches prepared ahead of training")
+    parser.add_argument("--seed", type=int, default=None, help="seed for the order of the experiences")
+    parser.add_argument("--target-sync", type=int, default=0,
+                        help="training steps between syncs of a target network, 0 to not use one")
+    parser.add_argument("--target-tau", type=float, default=1.0,
+                        help="fraction of the way the target network catches up at every sync, 1 to copy it")
+    parser.add_argument("--double", action="store_true", help="use Double DQN with the target network (needs --target-sync)")
+    args = parser.parse_args()
+    main(args.trajectories, epochs=args.epochs, batch_size=args.batch_size, learning_rate=args.learning_rate,
+         discount=args.discount, layer_size=args.layer_size, resume=args.resume, output=args.output,
+         block_size=args.block_size, shuffle_blocks=args.shuffle_blocks, prefetch=args.prefetch, seed=args.seed,
+         target_sync=args.target_sync, target_tau=args.target_tau, double=args.double)
@@ -0,0 +1,190 @@
+###############################################################################################
+# Use this file to play against a trained model, or to watch two of them play each other, e.g.
+#   python play.py --right checkpoints/game_50.ckpt.npz
+# A paddle without a model is played with the keys from game_env.py (up and down arrow keys on
+# the right, W and S on the left). Models run in a background thread that always works on the
+# latest state, so the game keeps running at 100 fps even if a model is slow to answer. How
+# long the models take and how many frames they missed is shown in the title bar and printed
+# at the end.
+###############################################################################################
+import argparse
+import random
+import threading
+import time
+import numpy as np
+import pygame
+from game_env import Paddle, Ball, Renderer, w, h
+from features import Featurizer
+from agents import NumpyPolicy, QTable
+
+
+def load_policy(filepath):
+    """
+    :param filepath: checkpoint or DQN.export .npz file, QTable .qtable.npz file (or .npy from older versions), or a
+                     model saved by an older version (.ai)
+    :return: an agent that plays its best move every frame
+    """
+    if filepath.endswith('.qtable.npz'):
+        return QTable.load(filepath, exploration_rate=0.0)[0]
+    if filepath.endswith('.npy'):
+        return QTable(filepath=filepath, exploration_rate=0.0)
+    if filepath.endswith('.ai'):  # needs keras to be read, but is still run with NumPy from then on
+        from agents import DQN
+        return NumpyPolicy(DQN(filepath=filepath).model.get_weights())
+    return NumpyPolicy(filepath=filepath)
+
+
+class InferenceWorker:
+    """
+    Runs a policy in a background thread. The game submits the latest state every frame without waiting, and reads
+    whichever action the policy last decided on. If the policy is still busy with an older state, states submitted in
+    the meantime replace each other and only the newest one is worked on next.
+    """
+    def __init__(self, policy):
+        self.policy = policy
+        self.action = 1  # stay until the first decision
+        self.submitted = 0  # number of states submitted so far
+        self.answered = 0  # number of the submitted state that action was decided from
+        self.latencies = []  # seconds between each answered state being submitted and its action being published
+        self._state = None
+        self._submitted_at = 0.0
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, state):
+        with self._lock:
+            self._state = np.array(state, dtype=np.float32)
+            self.submitted += 1
+            self._submitted_at = time.perf_counter()
+        self._ready.set()
+
+    def _run(self):
+        while True:
+            self._ready.wait()
+            self._ready.clear()
+            if self._closed:
+                return
+            with self._lock:
+                state, number, submitted_at = self._state, self.submitted, self._submitted_at
+            action = int(self.policy.get_next_action(state))
+            self.action = action
+            self.answered = number
+            self.latencies.append(time.perf_counter() - submitted_at)
+
+    def close(self):
+        self._closed = True
+        self._ready.set()
+        self._thread.join()
+
+
+def _describe(name, worker, missed, frames):
+    latencies = np.array(worker.latencies) * 1000
+    if not len(latencies):
+        return name + ": no decisions yet"
+    return (name + ": " + str(round(float(np.percentile(latencies, 50)), 3)) + " ms median, " +
+            str(round(float(np.percentile(latencies, 99)), 3)) + " ms p99, " + str(missed) + "/" + str(frames) +
+            " frames missed")
+
+
+def main(left=None, right=None, points=10, seed=None):
+    """
+    Plays a match to points, like game_env.main but with either paddle (or both) played by a model.
+    :param left: model file for the left paddle, or None for W and S
+    :param right: model file for the right paddle, or None for the arrow keys
+    :param seed: seed for the direction of every new ball
+    :return: dict mapping each side played by a model to its latencies (in seconds), missed frames and frames played
+    """
+    rng = random.Random(seed) if seed is not None else None
+    workers = [InferenceWorker(load_policy(model)) if model else None for model in (left, right)]
+    names = ['left', 'right']
+    missed = [0, 0]  # frames that a model's action was decided from an older state than the one just before
+    featurizer = Featurizer()
+    states = np.zeros((2, 5), dtype=np.float32)
+
+    win = pygame.display.set_mode((w, h))
+    pygame.display.set_caption("Pong")
+    win_font = pygame.font.SysFont("comicsans", 50)
+    clock = pygame.time.Clock()
+    renderer = Renderer(win)
+    paddles, ball = [Paddle(8), Paddle(w - 24)], Ball(rng)
+    score2, score1 = 0, 0
+    frames = 0
+
+    def submit_states():
+        featurizer.compute_objects(paddles, ball, out=states)
+        for worker, state in zip(workers, states):
+            if worker:
+                worker.submit(state)
+
+    renderer.draw(paddles, ball, score2, score1, True)
+    submit_states()
+    pygame.time.delay(1000)
+    running = True
+    try:
+        while running and score1 < points and score2 < points:
+            clock.tick(100)
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
+            frames += 1
+
+            keys = pygame.key.get_pressed()
+            moves = [(keys[pygame.K_w], keys[pygame.K_s]), (keys[pygame.K_UP], keys[pygame.K_DOWN])]
+            for i, (paddle, worker) in enumerate(zip(paddles, workers)):
+                if worker:
+                    if worker.answered < worker.submitted:  # still busy with the state from the last frame
+                        missed[i] += 1
+                    moves[i] = (worker.action == 0, worker.action == 2)
+                paddle.currvel = 0
+                paddle.keys['up'], paddle.keys['down'] = moves[i]
+                paddle.move()
+
+            if ball.move(paddles):
+                if ball.x > w // 2:
+                    score2 += 1
+                else:
+                    score1 += 1
+                renderer.draw(paddles, ball, score2, score1)
+                pygame.time.delay(1000)
+                if score1 < points and score2 < points:
+                    paddles, ball = [Paddle(8), Paddle(w - 24)], Ball(rng)
+                    renderer.draw(paddles, ball, score2, score1, True)
+                    pygame.time.delay(1000)
+            else:
+                renderer.draw(paddles, ball, score2, score1)
+            submit_states()  # the models work out their next moves while the clock waits for the next frame
+
+            if frames % 100 == 0 and any(workers):
+                pygame.display.set_caption("Pong - " + "; ".join(_describe(name, worker, count, frames)
+                                           for name, worker, count in zip(names, workers, missed) if worker))
+
+        if score1 >= points or score2 >= points:
+            win_label = win_font.render(("P1" if score1 >= points else "P2") + " WINS!", 1, (255, 255, 255))
+            win.blit(win_label, ((w - win_label.get_width()) // 2, (h - win_label.get_height()) // 2))
+            pygame.display.update()
+            pygame.time.delay(1000)
+    finally:
+        for worker in workers:
+            if worker:
+                worker.close()
+        pygame.quit()
+
+    report = {}
+    for name, worker, count in zip(names, workers, missed):
+        if worker:
+            print(_describe(name, worker, count, frames))
+            report[name] = {'latencies': worker.latencies, 'missed_frames': count, 'frames': frames}
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play pong against a trained model, or watch two models play.")
+    parser.add_argument("--left", default=None, help="model playing the left paddle, W and S if not given")
+    parser.add_argument("--right", default=None, help="model playing the right paddle, arrow keys if not given")
+    parser.add_argument("--points", type=int, default=10, help="points needed to win")
+    parser.add_argument("--seed", type=int, default=None, help="seed for the direction of every new ball")
+    args = parser.parse_args()
+    main(left=args.left, right=args.right, points=args.points, seed=args.seed)
@@ -0,0 +1,183 @@
+###############################################################################################
+# Experience replay for the DQN in agents.py.
+# Instead of training on every transition once, the moment it happens, transitions are stored in
+# a fixed-size ring buffer and the network is trained on random minibatches drawn from it.
+# All of the memory is allocated up front, so memory use never grows past the chosen capacity.
+###############################################################################################
+import numpy as np
+
+
+class ReplayBuffer:
+    """
+    Fixed-capacity ring buffer of (state, action, reward, next_state) transitions stored column-wise in NumPy arrays.
+    Once full, the oldest transitions are overwritten first.
+    """
+    def __init__(self, capacity, state_size=5, seed=None):
+        """
+        :param capacity: maximum number of transitions kept in memory
+        :param state_size: number of inputs used to define each state (5 for the states from get_states)
+        :param seed: seed for picking which transitions to train on
+        """
+        self.capacity = capacity
+        self.states = np.zeros((capacity, state_size), dtype=np.float32)
+        self.actions = np.zeros(capacity, dtype=np.int32)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_states = np.zeros((capacity, state_size), dtype=np.float32)
+        self.position = 0  # index that the next transition will be written to
+        self.size = 0
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, state, action, reward, next_state):
+        """
+        Stores a single transition, overwriting the oldest one if the buffer is full.
+        :return: index the transition was stored at
+        """
+        index = self.position
+        self.states[index] = state
+        self.actions[index] = action
+        self.rewards[index] = reward
+        self.next_states[index] = next_state
+        self.position = (index + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return index
+
+    def add_batch(self, states, actions, rewards, next_states):
+        """
+        Stores many transitions at once, wrapping around the end of the buffer if needed.
+        :return: indexes the transitions were stored at
+        """
+        count = len(actions)
+        if count > self.capacity:  # only the newest transitions would survive anyway
+            states, actions = states[-self.capacity:], actions[-self.capacity:]
+            rewards, next_states = rewards[-self.capacity:], next_states[-self.capacity:]
+            count = self.capacity
+        indexes = (self.position + np.arange(count)) % self.capacity
+        self.states[indexes] = states
+        self.actions[indexes] = actions
+        self.rewards[indexes] = rewards
+        self.next_states[indexes] = next_states
+        self.position = (self.position + count) % self.capacity
+        self.size = min(self.size + count, self.capacity)
+        return indexes
+
+    def sample(self, batch_size):
+        """
+        Picks batch_size transitions uniformly at random (with replacement).
+        :return: (indexes, states, actions, rewards, next_states, weights). weights are the importance-sampling
+                 weights for each transition, which are all equal (None) for uniform sampling.
+        """
+        indexes = self.rng.integers(0, self.size, size=batch_size)
+        return (indexes, self.states[indexes], self.actions[indexes], self.rewards[indexes],
+                self.next_states[indexes], None)
+
+    def update_priorities(self, indexes, td_errors):
+        pass  # every transition is equally likely to be picked, so there is nothing to update
+
+    def save(self, filepath):
+        """
+        Writes the stored transitions to an .npz file, oldest first.
+        """
+        indexes = (self.position - self.size + np.arange(self.size)) % self.capacity
+        np.savez(filepath, states=self.states[indexes], actions=self.actions[indexes], rewards=self.rewards[indexes],
+                 next_states=self.next_states[indexes])
+
+    def load(self, filepath):
+        """
+        Adds the transitions saved by save, as if they had just been added in the same order. Priorities aren't saved,
+        so a PrioritizedReplayBuffer gives all of them the highest priority.
+        """
+        with np.load(filepath) as data:
+            self.add_batch(data['states'], data['actions'], data['rewards'], data['next_states'])
+
+
+class SumTree:
+    """
+    Binary tree where every parent holds the sum of its two children, so that the leaves can be sampled in proportion
+    to their values in O(log n) time and a leaf can be changed in O(log n) time.
+    The tree is stored flat in an array: the root is at index 1 and the children of node i are at 2i and 2i + 1.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.leaf_count = 2
+        while self.leaf_count < capacity:  # rounding up to a power of two keeps every leaf at the same depth
+            self.leaf_count *= 2
+        self.tree = np.zeros(2 * self.leaf_count)
+
+    def total(self):
+        return self.tree[1]
+
+    def update(self, indexes, values):
+        """
+        Sets the leaves at indexes to values and recalculates the sums above them, one level of the tree at a time.
+        """
+        nodes = np.asarray(indexes) + self.leaf_count
+        self.tree[nodes] = values
+        while nodes[0] > 1:  # every node is on the same level, so they all reach the root together
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values):
+        """
+        Finds the leaves where the running total of the leaf values passes each of the given values.
+        :param values: array of numbers between 0 and total()
+        :return: leaf indexes, with the same shape as values
+        """
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        while nodes[0] < self.leaf_count:
+            left = 2 * nodes
+            go_right = values > self.tree[left]
+            values -= np.where(go_right, self.tree[left], 0)
+            nodes = left + go_right
+        return np.minimum(nodes - self.leaf_count, self.capacity - 1)
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """
+    Replay buffer that picks transitions in proportion to how wrong the network's estimate of them was (their TD
+    error) the last time they were trained on, so that surprising transitions like scoring or missing the ball get
+    replayed more often than the many uneventful frames in between.
+    """
+    def __init__(self, capacity, state_size=5, seed=None, alpha=0.6, beta=0.4, epsilon=1e-3):
+        """
+        :param alpha: how strongly priorities affect sampling (0 is uniform sampling)
+        :param beta: how strongly the bias of prioritized sampling is corrected with importance-sampling weights
+                     (1 corrects it fully)
+        :param epsilon: added to every priority so that no transition can become impossible to pick
+        """
+        super().__init__(capacity, state_size, seed)
+        self.alpha = alpha
+        self.beta = beta
+        self.epsilon = epsilon
+        self.tree = SumTree(capacity)
+        self.max_priority = 1.0
+
+    def add(self, state, action, reward, next_state):
+        index = super().add(state, action, reward, next_state)
+        # new transitions get the highest priority so far, making sure each one is trained on at least once
+        self.tree.update([index], [self.max_priority])
+        return index
+
+    def add_batch(self, states, actions, rewards, next_states):
+        indexes = super().add_batch(states, actions, rewards, next_states)
+        self.tree.update(indexes, np.full(len(indexes), self.max_priority))
+        return indexes
+
+    def sample(self, batch_size):
+        # splitting the total into equal segments and picking one value from each spreads the batch out
+        total = self.tree.total()
+        values = (np.arange(batch_size) + self.rng.random(batch_size)) * (total / batch_size)
+        indexes = self.tree.find(values)
+        probabilities = self.tree.tree[indexes + self.tree.leaf_count] / total
+        weights = (self.size * probabilities) ** -self.beta
+        weights = (weights / weights.max()).astype(np.float32)
+        return (indexes, self.states[indexes], self.actions[indexes], self.rewards[indexes],
+                self.next_states[indexes], weights)
+
+    def update_priorities(self, indexes, td_errors):
+        priorities = (np.abs(td_errors) + self.epsilon) ** self.alpha
+        self.tree.update(indexes, priorities)
+        self.max_priority = max(self.max_priority, float(priorities.max()))
@@ -0,0 +1,199 @@
+###############################################################################################
+# Use this file to tune the DQN's hyperparameters and the training rewards, e.g.
+#   python sweep.py --learning-rate 0.05 0.1 0.5 --discount 0.9 0.95 0.99 --save 25 50
+# Every combination of the given values (or --samples random ones) is trained headless in
+# parallel, scored against a scripted opponent every so often, and only the best half of them
+# carry on training each time (successive halving), so that most of the CPU time goes to the
+# configs that look most promising.
+###############################################################################################
+import argparse
+import itertools
+import json
+import math
+import multiprocessing as mp
+import os
+import random
+import time
+from agents import NumpyPolicy, FollowPolicy
+from checkpoint import snapshot, write_checkpoint, load_checkpoint
+from tournament import play_match
+from train_AI import TrainingGame, default_rewards
+
+# parameters of the DQN constructor that can be swept, everything else in a config goes to TrainingGame's rewards
+dqn_parameters = ('learning_rate', 'discount', 'exploration_rate', 'iterations', 'layer_size', 'batch_size',
+                  'train_every')
+
+
+def grid(space):
+    """
+    :param space: dict mapping each parameter to the list of values to try
+    :return: list of configs (dicts of one value per parameter), one for every combination of values
+    """
+    names = sorted(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def sample(space, count, seed=0):
+    """
+    :return: list of count configs, each value picked at random from the values in space, without repeats if possible
+    """
+    rng = random.Random(seed)
+    names = sorted(space)
+    total = math.prod(len(space[name]) for name in names)
+    if count >= total:
+        return grid(space)
+    picked = []
+    while len(picked) < count:
+        config = {name: rng.choice(space[name]) for name in names}
+        if config not in picked:
+            picked.append(config)
+    return picked
+
+
+def evaluate(policy, matches=4, points=10, seed=0):
+    """
+    Plays matches against FollowPolicy, switching sides every match.
+    :return: fraction of all points won by policy, between 0 and 1
+    """
+    won, lost = 0, 0
+    for match in range(matches):
+        if match % 2 == 0:
+            result = play_match(policy, FollowPolicy(), seed + match // 2, points)
+            won, lost = won + result['score_left'], lost + result['score_right']
+        else:
+            result = play_match(FollowPolicy(), policy, seed + match // 2, points)
+            won, lost = won + result['score_right'], lost + result['score_left']
+    return won / (won + lost) if won + lost else 0.0
+
+
+def _init_worker():
+    # every job runs on a core of its own, so tensorflow spreading each one over every core would only slow them down
+    import tensorflow
+    tensorflow.config.threading.set_intra_op_parallelism_threads(1)
+    tensorflow.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def run_job(job):
+    """
+    Trains one config for some more frames, continuing from its last checkpoint if it has one, then saves a new
+    checkpoint and evaluates it. The replay buffer is saved next to the checkpoint and refilled from it, so training
+    carries on from the same experiences. The game itself isn't saved: every rung starts a new one (with the same
+    game_num, so the rewards carry on) with serves from a seed of its own.
+    :param job: dict with the config, the number of frames to train for and where to save
+    :return: dict with the job's id, its score, where it was saved and how long it took
+    """
+    start = time.perf_counter()
+    config = job['config']
+    dqn_kwargs = {name: value for name, value in config.items() if name in dqn_parameters}
+    rewards = {name: value for name, value in config.items() if name not in dqn_parameters}
+    replay_kwargs = {name: dqn_kwargs[name] for name in ('batch_size', 'train_every') if name in dqn_kwargs}
+    game_num = 1
+    if job['checkpoint']:
+        agent, metadata = load_checkpoint(job['checkpoint'], replay_size=job['replay_size'], seed=job['seed'],
+                                          **replay_kwargs)
+        game_num = metadata['game_num']
+    else:
+        from agents import DQN
+        agent = DQN(replay_size=job['replay_size'], seed=job['seed'], **dqn_kwargs)
+    replay = os.path.join(job['directory'], 'config_' + str(job['id']) + '.replay.npz')
+    if job['checkpoint'] and agent.replay is not None and os.path.exists(replay):
+        agent.replay.load(replay)
+    game = TrainingGame(game_num, seed=job['seed'], rewards=rewards)
+    game.play(agent, job['frames'])
+
+    checkpoint = os.path.join(job['directory'], 'config_' + str(job['id']) + '.ckpt.npz')
+    write_checkpoint(checkpoint, snapshot(agent, game.game_num))
+    if agent.replay is not None:
+        agent.replay.save(replay)
+    score = evaluate(NumpyPolicy(agent.model.get_weights()), job['eval_matches'], job['points'], job['eval_seed'])
+    return {'id': job['id'], 'score': score, 'checkpoint': checkpoint, 'game_num': game.game_num,
+            'seconds': time.perf_counter() - start}
+
+
+def run(configs, min_frames=20000, eta=2, rungs=None, processes=None, directory='sweep', replay_size=50000,
+        eval_matches=4, points=10, seed=0):
+    """
+    Runs successive halving over configs: every surviving config is trained up to a budget of frames and evaluated,
+    then only the best 1/eta of them survive and the budget is multiplied by eta, until one config is left.
+    :param min_frames: frames every config is trained for before the first evaluation
+    :param eta: how aggressively configs are dropped, and how much the budget grows each time
+    :param rungs: number of evaluations to stop after, by default as many as it takes to get down to one config
+    :param processes: number of jobs trained in parallel, defaults to one per CPU core
+    :param directory: folder the checkpoints of every config and the results are saved to
+    :param eval_matches: matches against the scripted opponent that every evaluation is made of
+    :param seed: base seed for training, the evaluations always use the same seed so that scores are comparable
+    :return: list of dicts describing every config and its scores, best first
+    """
+    os.makedirs(directory, exist_ok=True)
+    if rungs is None:
+        rungs = 1 + math.ceil(math.log(len(configs), eta)) if len(configs) > 1 else 1
+    runs = [{'id': i, 'config': config, 'scores': [], 'frames': 0, 'checkpoint': None, 'stopped_at': None}
+            for i, config in enumerate(configs)]
+    alive = list(range(len(runs)))
+    budget = min_frames
+    ctx = mp.get_context("spawn")  # workers start fresh, so the tensorflow thread limits can be set before it loads
+    pool = ctx.Pool(processes or mp.cpu_count(), initializer=_init_worker)
+    try:
+        for rung in range(rungs):
+            jobs = [{'id': i, 'config': runs[i]['config'], 'frames': budget - runs[i]['frames'],
+                     'checkpoint': runs[i]['checkpoint'], 'directory': directory, 'replay_size': replay_size,
+                     'seed': seed + 1000 * i + rung, 'eval_matches': eval_matches, 'points': points,
+                     'eval_seed': seed} for i in alive]
+            for result in pool.imap_unordered(run_job, jobs):
+                entry = runs[result['id']]
+                entry['scores'].append(result['score'])
+                entry['frames'] = budget
+                entry['checkpoint'] = result['checkpoint']
+                print("Rung", rung, "- config", result['id'], entry['config'], "scored", round(result['score'], 3),
+                      "after", budget, "frames in", round(result['seconds'], 1), "s")
+            if rung == rungs - 1 or len(alive) == 1:
+                break
+            alive.sort(key=lambda i: (-runs[i]['scores'][-1], i))
+            for i in alive[max(len(alive) // eta, 1):]:
+                runs[i]['stopped_at'] = rung
+            alive = alive[:max(len(alive) // eta, 1)]
+            budget *= eta
+    finally:
+        pool.close()  # as in tournament.py, pygame keeps Pool.terminate from killing the workers
+        pool.join()
+
+    # configs that got further rank higher, then by their last score
+    results = sorted(runs, key=lambda entry: (-len(entry['scores']), -entry['scores'][-1] if entry['scores'] else 0))
+    with open(os.path.join(directory, 'results.json'), 'w') as f:
+        json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep DQN hyperparameters and rewards with successive halving.")
+    parser.add_argument("--learning-rate", type=float, nargs="+")
+    parser.add_argument("--discount", type=float, nargs="+")
+    parser.add_argument("--exploration-rate", type=float, nargs="+")
+    parser.add_argument("--iterations", type=int, nargs="+", help="experiences over which exploration goes down to 0")
+    parser.add_argument("--layer-size", type=int, nargs="+")
+    parser.add_argument("--batch-size", type=int, nargs="+")
+    parser.add_argument("--train-every", type=int, nargs="+")
+    for name, value in default_rewards.items():  # every reward in train_AI can be swept too
+        parser.add_argument("--" + name.replace('_', '-'), type=int, nargs="+",
+                            help="reward setting " + name + " (" + str(value) + " by default)")
+    parser.add_argument("--samples", type=int, default=None,
+                        help="try this many random combinations of the values instead of all of them")
+    parser.add_argument("--min-frames", type=int, default=20000, help="frames trained before the first evaluation")
+    parser.add_argument("--eta", type=int, default=2, help="keep the best 1/eta configs after every evaluation")
+    parser.add_argument("--rungs", type=int, default=None, help="number of evaluations before stopping")
+    parser.add_argument("--processes", type=int, default=None, help="configs trained in parallel")
+    parser.add_argument("--directory", default="sweep", help="folder to save checkpoints and results.json to")
+    parser.add_argument("--replay-size", type=int, default=50000, help="experiences remembered for experience replay")
+    parser.add_argument("--eval-matches", type=int, default=4,
+                        help="matches against the scripted opponent per evaluation")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    space = {name: values for name, values in vars(args).items()
+             if values is not None and (name in dqn_parameters or name in default_rewards)}
+    configs = sample(space, args.samples, args.seed) if args.samples else grid(space)
+    results = run(configs, min_frames=args.min_frames, eta=args.eta, rungs=args.rungs, processes=args.processes,
+                  directory=args.directory, replay_size=args.replay_size, eval_matches=args.eval_matches,
+                  seed=args.seed)
+    best = results[0]
+    print("Best config:", best['config'], "scored", round(best['scores'][-1], 3), "- saved to", best['checkpoint'])
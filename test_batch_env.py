@@ -0,0 +1,5 @@
+import batch_env
+
+
+def test_batch_env_matches_scalar_game():
+    batch_env.check_parity(n_games=32, n_frames=3000, seed=0)
@@ -0,0 +1,5 @@
+import fast_forward
+
+
+def test_fast_forward_matches_frame_by_frame():
+    fast_forward.check_parity(rallies=500, seed=0)
@@ -0,0 +1,206 @@
+###############################################################################################
+# Use this file to find out which saved models play best, without watching any of them, e.g.
+#   python tournament.py checkpoints --rounds 4
+# Every model plays every other one in headless matches to 10 points, as in game_env.py, spread
+# over all CPU cores. Matches are seeded, so running the same tournament twice gives the same
+# results. Models are run with NumPy (see NumpyPolicy), so the workers never load tensorflow.
+###############################################################################################
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+import os
+import random
+import numpy as np
+from game_env import Paddle, Ball, w
+from features import Featurizer
+from agents import NumpyPolicy
+from checkpoint import list_checkpoints
+
+# a tournament rally with no point after this many frames (30 seconds at 100 fps) is abandoned and served again,
+# and a match with too many of them is a draw, so that two purely defensive models can't hold up the pool forever
+rally_frame_limit = 3000
+max_stalls = 10
+
+
+def find_models(paths):
+    """
+    :param paths: checkpoint directories, or individual .npz files (checkpoints or DQN.export files) and old .ai models
+    :return: list of model files, directories expanded into their checkpoints from oldest to newest
+    """
+    models = []
+    for path in paths:
+        models.extend(list_checkpoints(path) if os.path.isdir(path) else [path])
+    return models
+
+
+def load_weights(filepath):
+    """
+    :return: list of alternating kernels and biases of the model saved in filepath
+    """
+    if filepath.endswith('.ai'):  # models saved by older versions need keras to be read
+        from agents import DQN
+        return DQN(filepath=filepath).model.get_weights()
+    return NumpyPolicy(filepath=filepath).get_weights()
+
+
+def play_match(left, right, seed, points=10):
+    """
+    Plays a headless match between two players until one of them reaches points.
+    :param left: policy playing on the left, anything with a get_next_action(state) method (e.g. NumpyPolicy)
+    :param right: policy playing on the right
+    :param seed: seed for the serves
+    :return: dict with the score of each side, the number of rallies, stalled rallies and frames played
+    """
+    rng = random.Random(seed)
+    policies = [left, right]
+    featurizer = Featurizer()
+    states = np.zeros((2, 5), dtype=np.float32)
+    scores = [0, 0]  # [left, right]
+    rallies, stalls, frames = 0, 0, 0
+    while max(scores) < points and stalls < max_stalls:
+        paddles, ball = [Paddle(8), Paddle(w - 24)], Ball(rng)
+        rallies += 1
+        for _ in range(rally_frame_limit):
+            featurizer.compute_objects(paddles, ball, out=states)
+            for paddle, policy, state in zip(paddles, policies, states):
+                action = policy.get_next_action(state)
+                paddle.currvel = 0
+                paddle.keys['up'] = action == 0
+                paddle.keys['down'] = action == 2
+                paddle.move()
+            frames += 1
+            if ball.move(paddles):
+                scores[0 if ball.x > w // 2 else 1] += 1
+                break
+        else:
+            stalls += 1
+    return {'score_left': scores[0], 'score_right': scores[1], 'rallies': rallies, 'stalls': stalls,
+            'frames': frames}
+
+
+_weights = None  # every model's weights, loaded once per worker process
+
+
+def _init_worker(weights):
+    global _weights
+    _weights = weights
+
+
+def _play(task):
+    left, right, seed, points, exploration_rate = task
+    policies = [NumpyPolicy(_weights[left], exploration_rate=exploration_rate, seed=seed),
+                NumpyPolicy(_weights[right], exploration_rate=exploration_rate, seed=seed + 1)]
+    result = play_match(policies[0], policies[1], seed, points)
+    result.update(left=left, right=right, seed=seed)
+    return result
+
+
+def elo_ratings(count, results, iterations=1000):
+    """
+    Fits Elo ratings to the results of every match at once (a Bradley-Terry model), so that unlike updating the ratings
+    after each match, the order the matches were played in doesn't matter.
+    Every model also gets one virtual draw against an average model, which keeps the ratings finite for models that
+    won or lost every match.
+    :param count: number of models
+    :param results: list of (model, opponent, score) where score is 1 for a win, 0.5 for a draw and 0 for a loss
+    :return: array of count ratings, averaging 1500
+    """
+    wins = np.full(count, 0.5)
+    games = np.zeros((count, count))
+    for model, opponent, score in results:
+        wins[model] += score
+        wins[opponent] += 1 - score
+        games[model, opponent] += 1
+        games[opponent, model] += 1
+    strength = np.ones(count)
+    for _ in range(iterations):  # minorization-maximization updates, which always converge for this model
+        previous = strength
+        strength = wins / ((games / (strength[:, None] + strength[None, :])).sum(axis=1) + 1 / (strength + 1))
+        strength /= np.exp(np.log(strength).mean())
+        if np.allclose(strength, previous, rtol=1e-9, atol=0):
+            break
+    return 1500 + 400 * np.log10(strength)
+
+
+def run(models, rounds=2, points=10, seed=0, processes=None, exploration_rate=0.0):
+    """
+    Plays every pair of models against each other rounds times, switching sides every round.
+    :param models: model files, see find_models
+    :param rounds: matches played by every pair. Each round uses a different seed, and the same seed is used for every
+                   pair in a round, so every model faces the same serves
+    :param processes: number of worker processes, defaults to one per CPU core
+    :param exploration_rate: chance of random moves, which makes matches between the same models differ between rounds
+    :return: (standings, matches) where standings has a dict of stats for every model, sorted by Elo rating
+    """
+    weights = [load_weights(model) for model in models]
+    tasks = []
+    for round_num in range(rounds):
+        for a, b in itertools.combinations(range(len(models)), 2):
+            left, right = (a, b) if round_num % 2 == 0 else (b, a)
+            tasks.append((left, right, seed + round_num, points, exploration_rate))
+    processes = processes or mp.cpu_count()
+    ctx = mp.get_context("spawn")
+    pool = ctx.Pool(processes, initializer=_init_worker, initargs=(weights,))
+    try:
+        matches = list(pool.imap_unordered(_play, tasks, chunksize=max(len(tasks) // (8 * processes), 1)))
+    finally:
+        # the workers are left to exit on their own, since pygame keeps them from being killed by Pool.terminate
+        pool.close()
+        pool.join()
+    matches.sort(key=lambda match: (match['seed'], match['left'], match['right']))
+
+    stats = [{'model': model, 'matches': 0, 'wins': 0, 'draws': 0, 'losses': 0, 'points_for': 0, 'points_against': 0,
+              'rallies': 0, 'frames': 0} for model in models]
+    outcomes = []
+    for match in matches:
+        for side, other in (('left', 'right'), ('right', 'left')):
+            entry = stats[match[side]]
+            entry['matches'] += 1
+            entry['points_for'] += match['score_' + side]
+            entry['points_against'] += match['score_' + other]
+            entry['rallies'] += match['rallies']
+            entry['frames'] += match['frames']
+        left_points, right_points = match['score_left'], match['score_right']
+        if max(left_points, right_points) < points:  # too many stalled rallies
+            score = 0.5
+        else:
+            score = 1.0 if left_points > right_points else 0.0
+        stats[match['left']]['wins' if score == 1 else 'draws' if score == 0.5 else 'losses'] += 1
+        stats[match['right']]['wins' if score == 0 else 'draws' if score == 0.5 else 'losses'] += 1
+        outcomes.append((match['left'], match['right'], score))
+
+    ratings = elo_ratings(len(models), outcomes)
+    for entry, rating in zip(stats, ratings):
+        entry['elo'] = round(float(rating), 1)
+        entry['win_rate'] = (entry['wins'] + entry['draws'] / 2) / entry['matches'] if entry['matches'] else 0.0
+        entry['average_rally_frames'] = entry['frames'] / entry['rallies'] if entry['rallies'] else 0.0
+    standings = sorted(stats, key=lambda entry: -entry['elo'])
+    return standings, matches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rank saved models with a round-robin tournament.")
+    parser.add_argument("models", nargs="+", help="checkpoint directories or model files")
+    parser.add_argument("--rounds", type=int, default=2, help="matches played by every pair of models")
+    parser.add_argument("--points", type=int, default=10, help="points needed to win a match")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first round")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes, one per CPU core by default")
+    parser.add_argument("--exploration-rate", type=float, default=0.0, help="chance of random moves during matches")
+    parser.add_argument("--output", help="file to write the standings and every match result to as JSON")
+    args = parser.parse_args()
+
+    models = find_models(args.models)
+    if len(models) < 2:
+        parser.error("need at least two models, found " + str(len(models)))
+    standings, matches = run(models, rounds=args.rounds, points=args.points, seed=args.seed,
+                             processes=args.processes, exploration_rate=args.exploration_rate)
+    width = max(len(entry['model']) for entry in standings)
+    print("model".ljust(width), "   elo  win rate  W-D-L     avg rally (frames)")
+    for entry in standings:
+        print(entry['model'].ljust(width), str(entry['elo']).rjust(6), ("%.3f" % entry['win_rate']).rjust(9),
+              (str(entry['wins']) + '-' + str(entry['draws']) + '-' + str(entry['losses'])).ljust(9),
+              round(entry['average_rally_frames'], 1))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'standings': standings, 'matches': matches}, f, indent=2)
@@ -6,118 +6,148 @@
 #                           are for the right paddle and reward2 and score2 for the left.
 #                           However, the paddles list has them in the order [left, right].
 ###############################################################################################
+import argparse
+import os
+import random
+import numpy as np
 import pygame
-from game_env import Paddle, Ball, draw_window
-from agents import DQN
+from game_env import Paddle, Ball, Renderer
+from agents import DQN, QTable
+from features import get_states, Featurizer
+from fast_forward import fast_forward, frames_until_contact, frames_until_within
+from metrics import MetricsLogger
+from checkpoint import Checkpointer, load_checkpoint
+from trajectory import TrajectoryWriter
 import pickle
 
 pygame.init()
 w, h = 720, 400
 
-filepath = None  # add the name of the model here to load it in (without extension as config file will use the same name)
+# add the path of a checkpoint here (e.g. 'checkpoints/game_10.ckpt.npz') to resume training from it. models saved by
+# older versions can still be loaded by giving their name without extension, as the config file uses the same name.
+filepath = None
+# a rally with no point scored for this many simulated frames is treated as an infinite loop (150 seconds at 100 fps).
+# counting frames instead of wall-clock time keeps training identical no matter how fast the machine runs it.
+max_rally_frames = 15000
+# the heuristic that TrainingGame rewards the agents with. The agents are first rewarded for saving the ball, to learn to
+# defend, then for scoring more than for saving, to become aggressive once they can defend.
+default_rewards = {
+    'save': 50,  # for hitting the ball back, during the first defence_games_* games
+    'defence_games_right': 40,
+    'defence_games_left': 20,
+    'aim': 100,  # for hitting the ball towards where the opponent isn't
+    'score': 100,  # for scoring after the ball was hit at least once, during the first offence_games games
+    'offence_games': 40,
+    'late_score': 200,  # for scoring after that
+    'stall': -200,  # for both agents when a rally goes on for too long
+}
 
 
-def get_states(paddles, ball):
+class TrainingGame:
     """
-    Returns the state of the game from each paddle's perspective to be used as inputs for the DQN
-    Inputs for DQN (i.e. state, all inputs will be normalized):
-    >> recommended direction
-    >> y of opponent's middle
-    >> predicted y of ball when it reaches opponent
-    >> relative x distance of ball from agent
-    >> yvel of ball
+    A never-ending game of pong between two agents, along with the heuristic that decides the reward each of them gets
+    for every frame. Used by main, and by anything else that needs to train agents without a window.
     """
-    relx_left = ball.x - ball.radius - (paddles[0].x + paddles[0].width)
-    relx_right = paddles[1].x - (ball.x + ball.radius)
-    # predicting where the ball would hit on left and right sides, assuming no spin is applied
-    if ball.xvel < 0:
-        pred_left = ball.y + ball.yvel * relx_left // abs(ball.xvel)
-        mod = 1
-        if pred_left < 0:
-            pred_left = -pred_left
-            mod = -1
-        elif pred_left > h:
-            pred_left = -pred_left + 2 * h
-            mod = -1
-        pred_right = pred_left + mod * ball.yvel * (w - 2 * (paddles[0].x + paddles[0].width + ball.radius)) // abs(
-            ball.xvel)
-        if pred_right < 0:
-            pred_right = -pred_right
-        elif pred_right > h:
-            pred_right = -pred_right + 2 * h
-    else:
-        pred_right = ball.y + ball.yvel * relx_right // abs(ball.xvel)
-        mod = 1
-        if pred_right < 0:
-            pred_right = -pred_right
-            mod = -1
-        elif pred_right > h:
-            pred_right = -pred_right + 2 * h
-            mod = -1
-        pred_left = pred_right + mod * ball.yvel * (w - 2 * (paddles[0].x + paddles[0].width + ball.radius)) // abs(
-            ball.xvel)
-        if pred_left < 0:
-            pred_left = -pred_left
-        elif pred_left > h:
-            pred_left = -pred_left + 2 * h
-    if pred_left > (paddles[0].y + paddles[0].height // 2) and paddles[0].y + paddles[0].height != h:
-        rec_left = 1  # recommended to move down
-    elif pred_left < (paddles[0].y + paddles[0].height // 2) and paddles[0].y != 0:
-        rec_left = -1  # recommeded to move up
-    else:
-        rec_left = 0
-    if pred_right > (paddles[1].y + paddles[1].height // 2) and paddles[1].y + paddles[1].height != h:
-        rec_right = 1  # recommended to move down
-    elif pred_right < (paddles[1].y + paddles[1].height // 2) and paddles[1].y != 0:
-        rec_right = -1  # recommeded to move up
-    else:
-        rec_right = 0
-    # input states for left and right agents
-    state_left = [rec_left, (paddles[1].y + paddles[1].height // 2) / h,
-                  pred_right / h, relx_left / w, ball.yvel / ball.softcap]
-    state_right = [rec_right, (paddles[0].y + paddles[0].height // 2) / h,
-                   pred_left / h, relx_right / w, ball.yvel / ball.softcap]
-    return state_left, state_right
-
-
-def main():
-    win = pygame.display.set_mode((w, h))
-    pygame.display.set_caption("Pong")
-    font = pygame.font.SysFont("comicsans", 30)
-    win_font = pygame.font.SysFont("comicsans", 50)
-    clock = pygame.time.Clock()
-    running = True
-    paddles = [Paddle(8), Paddle(w - 24)]
-    ball = Ball()
-    game_num = 1
-    if filepath:
-        with open((filepath + '_config.pkl'), 'rb') as f:
-            exp_rate, iters, game_num = pickle.load(f)
-        agent = DQN(exploration_rate=exp_rate, iterations=iters, filepath=(filepath + '.ai'))
-    else:
-        agent = DQN()
-    dead_ball = 0
-    score2, score1 = 0, 0
-    reward1, reward2 = 0, 0
-    draw_window(win, paddles, ball, score2, score1, True, game_num=game_num)
-    pygame.time.delay(1000)
-    tapped = 0  # for detecting when a paddle was not able to block the initial random ball
-    start_ticks = pygame.time.get_ticks()  # to prevent infinite loop, break after 20 seconds of no scoring
-    save_counter = 0
-    while running:
-        clock.tick(100)
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
+    def __init__(self, game_num=1, max_rally_frames=max_rally_frames, seed=None, rewards=None, metrics=None):
+        """
+        :param game_num: number of the current game, which changes the rewards as training goes on
+        :param max_rally_frames: number of simulated frames without a point before a rally is declared an infinite loop
+        :param seed: seed for the direction of every new ball, to make games reproducible
+        :param rewards: dict overriding any of the values in default_rewards
+        :param metrics: MetricsLogger to time the simulation and featurization inside step with, or None
+        """
+        self.rewards = dict(default_rewards, **(rewards or {}))
+        self.rng = random.Random(seed) if seed is not None else None  # None uses the global random module
+        self.paddles = [Paddle(8), Paddle(w - 24)]
+        self.ball = Ball(self.rng)
+        self.game_num = game_num
+        self.score2, self.score1 = 0, 0
+        self.tapped = 0  # for detecting when a paddle was not able to block the initial random ball
+        self.rally_frames = 0  # to prevent infinite loop, break after max_rally_frames frames of no scoring
+        self.max_rally_frames = max_rally_frames
+        # tapped, rally_frames, the scores and game_num change when a rally ends, so these keep their values for the
+        # rally that just ended, including the point it ended with
+        self.last_rally_bounces = 0
+        self.last_rally_frames = 0
+        self.last_rally_score2, self.last_rally_score1 = 0, 0
+        self.last_rally_game_num = game_num
+        self.metrics = metrics
+        self.featurizer = Featurizer()
+        # states are written into two alternating buffers, so the ones returned by a step stay intact until the one
+        # after the next. each buffer holds the [left, right] states.
+        self._states = np.zeros((2, 2, 5), dtype=np.float32)
+        self._current = 0
+        self._fresh = False  # whether _states[_current] matches the current positions of the ball and paddles
+
+    def _compute_states(self):
+        self._current ^= 1
+        self._fresh = True
+        return self.featurizer.compute_objects(self.paddles, self.ball, out=self._states[self._current])
+
+    def get_states(self):
+        """
+        :return: float32 array of shape (2, 5) holding the [left, right] states, the same values as get_states.
+                 It is overwritten two calls to step later, so copy it if it needs to be kept for longer.
+        """
+        if not self._fresh:
+            return self._compute_states()
+        return self._states[self._current]  # nothing moved since the last step computed these
+
+    def reset_rally(self):
+        # resets the ball and paddles regardless of game situation
+        # DEV NOTE FOR THE FUTURE: THIS IS THE ONLY BALL AND PADDLE RESET NORMALLY USED, COME HERE TO FIX BUGS
+        self.last_rally_bounces = self.tapped
+        self.last_rally_frames = self.rally_frames
+        self.last_rally_score2, self.last_rally_score1 = self.score2, self.score1
+        self.last_rally_game_num = self.game_num
+        self.paddles = [Paddle(8), Paddle(w - 24)]
+        self.ball = Ball(self.rng)
+        self.tapped = 0
+        self.rally_frames = 0
+        self._fresh = False
+
+    def skip(self, left_choice, right_choice, max_frames):
+        """
+        Plays up to max_frames frames with the same moves (see fast_forward.py), as long as nothing but plain movement
+        happens in them: no bounce, reward, point or stall. Stops before the first frame that could have any of those,
+        which is left to step. The states aren't computed for the frames played.
+        :return: number of frames played, 0 if the next frame needs step
+        """
+        paddles, ball = self.paddles, self.ball
+        # step rewards a hit in the frame after the ball bounced off a paddle's face, when it is this close to it
+        speed = abs(ball.xvel)
+        if ball.xvel < 0:
+            face = paddles[1].x - ball.radius
+            hit = frames_until_within(ball.x, ball.xvel, face - speed, face - 2)
+        else:
+            face = paddles[0].x + paddles[0].width + ball.radius
+            hit = frames_until_within(ball.x, ball.xvel, face + 2, face + speed)
+        frames = min(frames_until_contact(paddles, ball) - 1, hit - 1, max_frames,
+                     self.max_rally_frames - self.rally_frames)
+        if frames <= 0:
+            return 0
+        fast_forward(paddles, ball, left_choice, right_choice, frames)
+        self.rally_frames += frames
+        self._fresh = False
+        return frames
+
+    def step(self, left_choice, right_choice):
+        """
+        Moves both paddles according to the agents' choices (0 is up, 1 is stay, 2 is down), then moves the ball and
+        works out the reward each agent gets for the frame.
+        :return: (new_state_left, new_state_right, reward2, reward1, event). The new states are taken right after the
+                 move, before any reset. event is None for a normal frame, "point" when a point was scored and "stall"
+                 when the rally went on for too long - in both of those cases the ball and paddles have been reset.
+        """
+        paddles = self.paddles
+        ball = self.ball
+        self.rally_frames += 1
         reward1, reward2 = 0, 0  # resetting rewards at the beginning of each "experience"
-        state_left, state_right = get_states(paddles, ball)  # gets the state of the game from each paddle's perspective
         # defining movement
         for paddle in paddles:
             paddle.currvel = 0
             paddle.keys['up'] = False
             paddle.keys['down'] = False
-        left_choice = agent.get_next_action(state_left)
-        right_choice = agent.get_next_action(state_right)
         if right_choice == 0:
             paddles[1].keys['up'] = True
         elif right_choice == 2:
@@ -129,104 +159,267 @@ def main():
         for paddle in paddles:
             paddle.move()
         dead_ball = ball.move(paddles)
-        new_state_left, new_state_right = get_states(paddles, ball)  # gets the new state after actions are taken
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.lap('simulation')
+        new_state_left, new_state_right = self._compute_states()  # gets the new state after actions are taken
+        if metrics is not None:
+            metrics.lap('featurization')
+        # where the ball is predicted to reach each side, i.e. new_state_right[2] * h and new_state_left[2] * h
+        pred_left = self.featurizer.pred_left / h * h
+        pred_right = self.featurizer.pred_right / h * h
+        game_num = self.game_num
 
         # figuring out if the ball just hit one of the paddles
         if paddles[1].x - ball.radius - abs(ball.xvel) - 1 < ball.x < paddles[1].x - ball.radius - 1 and ball.xvel < 0:
             # hit the right paddle, above is true for exactly one frame each time
-            tapped += 1
-            # for the first 40 games, reward saving the ball to improve defence
-            if game_num <= 40:
-                reward1 = 50
-            if new_state_right[2] * h > paddles[0].y + paddles[0].height or new_state_right[2] * h < paddles[0].y:
+            self.tapped += 1
+            # for the first 40 games (by default), reward saving the ball to improve defence
+            if game_num <= self.rewards['defence_games_right']:
+                reward1 = self.rewards['save']
+            if pred_left > paddles[0].y + paddles[0].height or pred_left < paddles[0].y:
                 #ball is headed away from opponent
-                reward1 += 100
+                reward1 += self.rewards['aim']
         elif paddles[0].x + paddles[0].width + ball.radius + 1 < ball.x < paddles[0].x + paddles[0].width + ball.radius + abs(ball.xvel) + 1 and ball.xvel > 0:
             # hit the left paddle, above is true for exactly one frame each time
-            tapped += 1
-            # for the first 20 games, reward saving the ball to improve defence
-            if game_num <= 20:
-                reward2 = 50
-            if new_state_left[2] * h > paddles[1].y + paddles[1].height or new_state_left[2] * h < paddles[1].y:
+            self.tapped += 1
+            # for the first 20 games (by default), reward saving the ball to improve defence
+            if game_num <= self.rewards['defence_games_left']:
+                reward2 = self.rewards['save']
+            if pred_right > paddles[1].y + paddles[1].height or pred_right < paddles[1].y:
                 #ball is headed away from opponent
-                reward2 += 100
+                reward2 += self.rewards['aim']
 
+        event = None
         # for when ball is beyond saving i.e. point is scored and ball is "dead"
         if dead_ball:
             # assigns point
             if ball.x > w // 2:
-                score2 += 1
+                self.score2 += 1
                 reward1 = -(abs(ball.y - (paddles[1].y + paddles[1].height // 2)))  # a1 can't save the ball
                 # the negative feedback depends on how far away the ball was from the paddle, but is at least -50
-                if tapped:  # reward scorer only if they actually played a role
-                    if game_num <= 40:
-                        reward2 = 100
+                if self.tapped:  # reward scorer only if they actually played a role
+                    if game_num <= self.rewards['offence_games']:
+                        reward2 = self.rewards['score']
                     else:  # increases reward for being offensive later, after it learns to defend
-                        reward2 = 200
+                        reward2 = self.rewards['late_score']
             else:
-                score1 += 1
+                self.score1 += 1
                 reward2 = -(abs(ball.y - (paddles[0].y + paddles[0].height // 2)))  # a2 can't save the ball
-                if tapped:  # reward scorer only if they actually played a role
-                    if game_num <= 40:
-                        reward1 = 100
+                if self.tapped:  # reward scorer only if they actually played a role
+                    if game_num <= self.rewards['offence_games']:
+                        reward1 = self.rewards['score']
                     else:  # increases reward for being offensive later, after it learns to defend
-                        reward1 = 200
+                        reward1 = self.rewards['late_score']
+            self.reset_rally()
             # resets score and updates game number if 10 is reached by either side
-            if score1 == 10:
-                score1 = 0
-                score2 = 0
-                game_num += 1
-            elif score2 == 10:
-                score1 = 0
-                score2 = 0
-                game_num += 1
-            dead_ball = 0  # resetting dead_ball just in case, to prevent double counting from occuring
-            tapped = 0
-            # below line reset the ball and paddles regardless of game situation
-            # DEV NOTE FOR THE FUTURE: THIS IS THE ONLY BALL AND PADDLE RESET NORMALLY USED, COME HERE TO FIX BUGS
-            del ball
-            del paddles[0:2]
-            paddles.extend([Paddle(8), Paddle(w - 24)])
-            ball = Ball()
-            draw_window(win, paddles, ball, score2, score1, True, game_num=game_num)
-            # resets start_ticks, which is used to detect infinite loops
-            # print((pygame.time.get_ticks() - start_ticks)/1000)  # to check how fast the game is actually running
-            start_ticks = pygame.time.get_ticks()
+            if self.score1 == 10 or self.score2 == 10:
+                self.score1 = 0
+                self.score2 = 0
+                self.game_num += 1
+            event = "point"
         # in case of an infinite loop
-        elif (pygame.time.get_ticks() - start_ticks) / 1000 > 150:
-            # update the above number (150) accordingly based on how fast/slow your GPU can run this and how long to wait
-            #before declaring a rally an infinite loop
-            reward1, reward2 = -200, -200  # for getting into an infinite loop/taking too long to score
-            print("Infinite loop occurred after", tapped, "bounces")
-            dead_ball = 0
-            tapped = 0
-            # reset ball and paddles
-            del ball
-            del paddles[0:2]
-            paddles.extend([Paddle(8), Paddle(w - 24)])
-            ball = Ball()
-            draw_window(win, paddles, ball, score2, score1, True, game_num=game_num)
-            start_ticks = pygame.time.get_ticks()  # reset start_ticks
-        # normal, uneventful frame - movements of the entire loop iteration are finally rendered
+        elif self.rally_frames > self.max_rally_frames:
+            reward1 = reward2 = self.rewards['stall']  # for getting into an infinite loop/taking too long to score
+            self.reset_rally()
+            event = "stall"
+        return new_state_left, new_state_right, reward2, reward1, event
+
+    def play(self, agent, frames, action_repeat=1):
+        """
+        Plays and trains agent (on both paddles) for frames frames, the same way main does with headless=True, but
+        without metrics, recording or checkpoints.
+        :param action_repeat: number of frames each move is held for, see main
+        """
+        played = 0
+        while played < frames:
+            states = self.get_states()
+            if action_repeat > 1:
+                states = states.copy()  # the game reuses its state buffers every other frame
+            state_left, state_right = states
+            left_choice, right_choice = agent.get_next_actions(states)
+            hold = min(action_repeat, frames - played)
+            held = 0
+            total_reward2, total_reward1 = 0, 0
+            while True:
+                if held < hold - 1:
+                    held += self.skip(left_choice, right_choice, hold - 1 - held)
+                new_state_left, new_state_right, reward2, reward1, event = self.step(left_choice, right_choice)
+                held += 1
+                total_reward2 += reward2
+                total_reward1 += reward1
+                if held == hold or event is not None:
+                    break
+            agent.update(state_left, new_state_left, left_choice, total_reward2)
+            agent.update(state_right, new_state_right, right_choice, total_reward1)
+            played += held
+
+
+def main(headless=False, max_rally_frames=max_rally_frames, replay_size=50000, batch_size=32, train_every=4,
+         prioritized=False, metrics_path='training_metrics', metrics_sample_every=10, checkpoint_dir='checkpoints',
+         keep_checkpoints=5, render_every=1, seed=None, record_path=None, tabular=False, target_sync=0, target_tau=1.0,
+         double=False, action_repeat=1):
+    """
+    Trains the agent by making it play against itself forever (or until the window is closed).
+    :param headless: if True, no window is opened and nothing is drawn or frame-limited, so the simulation runs as fast
+                     as the CPU allows instead of being locked to 100 fps
+    :param max_rally_frames: number of simulated frames without a point before a rally is declared an infinite loop
+    :param replay_size: number of experiences remembered for experience replay (0 trains on every frame instead)
+    :param batch_size: number of remembered experiences trained on at a time
+    :param train_every: number of experiences collected between each training step
+    :param prioritized: if True, replays experiences with a larger error more often
+    :param metrics_path: start of the names of the CSV files that timings and rally summaries are written to
+    :param metrics_sample_every: time one in this many frames
+    :param checkpoint_dir: folder that a checkpoint is saved to every 10 games
+    :param keep_checkpoints: number of most recent checkpoints to keep
+    :param render_every: only draw (and wait for the 100 fps clock) once in this many frames, so that training can be
+                         watched while running render_every times faster
+    :param seed: seed for the balls and the agent's random moves, to make a run reproducible
+    :param record_path: file to record every experience to (see trajectory.py), or None to not record
+    :param tabular: if True, trains a QTable instead of a DQN (and filepath, if set, is a file saved by QTable.save)
+    :param target_sync: training steps between syncs of the DQN's target network, 0 for no target network
+    :param target_tau: fraction of the way the target network is moved towards the trained one at every sync
+    :param double: if True, uses Double DQN with the target network
+    :param action_repeat: number of frames the agents hold each move for. The rewards of those frames are added up into
+                          a single experience, so the agents decide and train action_repeat times less often. A point
+                          or stall ends the held move early. When headless, the held frames in which the ball only
+                          moves in a straight line are skipped through with TrainingGame.skip instead of stepped.
+    """
+    if not headless:
+        win = pygame.display.set_mode((w, h))
+        pygame.display.set_caption("Pong")
+        clock = pygame.time.Clock()
+        renderer = Renderer(win, render_every=render_every)
+    running = True
+    game_num = 1
+    if tabular:
+        if filepath:
+            agent, metadata = QTable.load(filepath, seed=seed)
+            game_num = metadata['game_num']
         else:
-            draw_window(win, paddles, ball, score2, score1, game_num=game_num)
-
-        print(reward2, reward1, tapped)  # for debugging
-        # update the agent for both paddle's experiences at the end of each iteration
-        agent.update(state_left, new_state_left, left_choice, reward2)
-        agent.update(state_right, new_state_right, right_choice, reward1)
-
-        if game_num % 10 == 0 and save_counter == 0:  # saves the model every 10 games
-            agent.model.save(filepath=('game_' + str(game_num) + '_model.ai'))
-            with open(('game_' + str(game_num) + '_model_config.pkl'), 'wb') as f:
-                pickle.dump([agent.exploration_rate, agent.iterations, game_num], f)
-            print("Successfully saved after", game_num, "games")
-            save_counter = 1
-        elif game_num % 10 != 0 and save_counter != 0:  # resets the counter allowing the game to be saved again
-            save_counter = 0
+            agent = QTable(seed=seed)
+    elif filepath and filepath.endswith('.npz'):
+        agent, metadata = load_checkpoint(filepath, replay_size=replay_size, batch_size=batch_size,
+                                          train_every=train_every, prioritized=prioritized, seed=seed,
+                                          target_sync=target_sync, target_tau=target_tau, double=double)
+        game_num = metadata['game_num']
+    elif filepath:  # model saved by an older version, with a separate config file
+        with open((filepath + '_config.pkl'), 'rb') as f:
+            exp_rate, iters, game_num = pickle.load(f)
+        agent = DQN(exploration_rate=exp_rate, iterations=iters, filepath=(filepath + '.ai'), replay_size=replay_size,
+                    batch_size=batch_size, train_every=train_every, prioritized=prioritized, seed=seed,
+                    target_sync=target_sync, target_tau=target_tau, double=double)
+    else:
+        agent = DQN(replay_size=replay_size, batch_size=batch_size, train_every=train_every, prioritized=prioritized,
+                    seed=seed, target_sync=target_sync, target_tau=target_tau, double=double)
+    metrics = MetricsLogger(metrics_path, sample_every=metrics_sample_every)
+    game = TrainingGame(game_num, max_rally_frames, seed=seed, metrics=metrics)
+    if not headless:
+        renderer.draw(game.paddles, game.ball, game.score2, game.score1, True, game_num=game.game_num)
+        pygame.time.delay(1000)
+    save_counter = 0
+    checkpointer = Checkpointer(checkpoint_dir, keep=keep_checkpoints)
+    recorder = TrajectoryWriter(record_path, seed=seed) if record_path else None
+    saved_tables = []  # tables saved by this run, oldest first, when training a QTable
+    held = 0  # frames the current moves have been held for
+    try:
+        while running:
+            metrics.start_frame()
+            rendering = not headless and renderer.tick()
+            if rendering:
+                clock.tick(100)
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT:
+                        running = False
+            if held == 0:  # time to pick new moves
+                states = game.get_states()  # the state of the game from each paddle's perspective
+                if action_repeat > 1:
+                    states = states.copy()  # the game reuses its state buffers every other frame
+                state_left, state_right = states
+                metrics.lap('featurization')
+                left_choice, right_choice = agent.get_next_actions(states)  # one forward pass for both
+                metrics.lap('inference')
+                total_reward2, total_reward1 = 0, 0
+            if headless and held < action_repeat - 1:  # nothing is drawn in between, so plain frames can be skipped
+                skipped = game.skip(left_choice, right_choice, action_repeat - 1 - held)
+                held += skipped
+                metrics.add_frames(skipped)
+            new_state_left, new_state_right, reward2, reward1, event = game.step(left_choice, right_choice)
+            held += 1
+            total_reward2 += reward2
+            total_reward1 += reward1
+            metrics.add_rewards(reward2, reward1)
+            if event is not None:  # a point was scored or the rally was declared an infinite loop
+                metrics.end_rally(game, event, agent.exploration_rate)
+            metrics.lap('simulation')
+            if rendering:
+                # after a point or an infinite loop the ball was reset, so the indicator shows where the new ball is headed
+                renderer.draw(game.paddles, game.ball, game.score2, game.score1, event is not None,
+                              game_num=game.game_num)
+                metrics.lap('rendering')
+
+            if held == action_repeat or event is not None:
+                held = 0
+                # update the agent for both paddle's experiences once the moves have been held for long enough
+                agent.update(state_left, new_state_left, left_choice, total_reward2)
+                agent.update(state_right, new_state_right, right_choice, total_reward1)
+                metrics.lap('training')
+                if recorder:
+                    recorder.append(state_left, left_choice, total_reward2, new_state_left, event is not None)
+                    recorder.append(state_right, right_choice, total_reward1, new_state_right, event is not None)
+            metrics.end_frame()
+
+            if game.game_num % 10 == 0 and save_counter == 0:  # saves the model every 10 games
+                if tabular:
+                    saved_tables.append(os.path.join(checkpoint_dir, 'game_' + str(game.game_num) + '.qtable.npz'))
+                    agent.save(saved_tables[-1], game.game_num)
+                    if keep_checkpoints and len(saved_tables) > keep_checkpoints:
+                        os.remove(saved_tables.pop(0))
+                else:
+                    checkpointer.save(agent, game.game_num)  # written to disk in the background
+                save_counter = 1
+            elif game.game_num % 10 != 0 and save_counter != 0:  # resets the counter allowing the game to be saved again
+                save_counter = 0
+    finally:
+        metrics.flush()  # also when training is stopped with ctrl+c
+        checkpointer.close()  # waits for any checkpoint still being written
+        if recorder:
+            recorder.close()
 
     pygame.quit()  # ends pygame instance before quitting the program
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Train the Deep Q-Learning network to play pong against itself.")
+    parser.add_argument("--headless", action="store_true",
+                        help="train without opening a window, as fast as the CPU allows")
+    parser.add_argument("--max-rally-frames", type=int, default=max_rally_frames,
+                        help="frames without a point before a rally is declared an infinite loop")
+    parser.add_argument("--replay-size", type=int, default=50000,
+                        help="experiences remembered for experience replay, 0 to train on every frame instead")
+    parser.add_argument("--batch-size", type=int, default=32, help="experiences trained on at a time")
+    parser.add_argument("--train-every", type=int, default=4, help="experiences collected between training steps")
+    parser.add_argument("--prioritized", action="store_true", help="replay experiences with a larger error more often")
+    parser.add_argument("--metrics-path", default="training_metrics",
+                        help="start of the names of the CSV files that timings and rally summaries are written to")
+    parser.add_argument("--metrics-sample-every", type=int, default=10, help="time one in this many frames")
+    parser.add_argument("--checkpoint-dir", default="checkpoints", help="folder to save a checkpoint to every 10 games")
+    parser.add_argument("--keep-checkpoints", type=int, default=5, help="number of most recent checkpoints to keep")
+    parser.add_argument("--render-every", type=int, default=1,
+                        help="only draw one in this many frames, to watch training at a higher speed")
+    parser.add_argument("--seed", type=int, default=None, help="seed to make the run reproducible")
+    parser.add_argument("--record", default=None, help="file to record every experience to")
+    parser.add_argument("--tabular", action="store_true", help="train a Q-table instead of the neural network")
+    parser.add_argument("--target-sync", type=int, default=0,
+                        help="training steps between syncs of a target network, 0 to not use one")
+    parser.add_argument("--target-tau", type=float, default=1.0,
+                        help="fraction of the way the target network catches up at every sync, 1 to copy it")
+    parser.add_argument("--double", action="store_true", help="use Double DQN with the target network (needs --target-sync)")
+    parser.add_argument("--action-repeat", type=int, default=1, help="frames to hold every move for")
+    args = parser.parse_args()
+    main(headless=args.headless, max_rally_frames=args.max_rally_frames, replay_size=args.replay_size,
+         batch_size=args.batch_size, train_every=args.train_every, prioritized=args.prioritized,
+         metrics_path=args.metrics_path, metrics_sample_every=args.metrics_sample_every,
+         checkpoint_dir=args.checkpoint_dir, keep_checkpoints=args.keep_checkpoints, render_every=args.render_every,
+         seed=args.seed, record_path=args.record, tabular=args.tabular, target_sync=args.target_sync,
+         target_tau=args.target_tau, double=args.double, action_repeat=args.action_repeat)
@@ -0,0 +1,125 @@
+###############################################################################################
+# Compact binary recordings of training experiences, so that any episode can be replayed and
+# debugged later, or trained on again without having to play the games.
+# A file is a small fixed-size header followed by fixed-width records of
+# (state, action, reward, next_state, done). Records are buffered in a preallocated chunk and
+# written out a chunk at a time, and files are read back by memory-mapping them, without copying.
+###############################################################################################
+import struct
+import numpy as np
+
+magic = b'PONGTRJ1'
+version = 1
+# magic, then version, state size and seed (-1 if none) as little-endian integers, padded to 32 bytes
+header_format = '<8sIIq'
+header_size = 32
+
+
+def record_dtype(state_size=5):
+    return np.dtype([('state', '<f4', (state_size,)), ('action', 'u1'), ('reward', '<f4'),
+                     ('next_state', '<f4', (state_size,)), ('done', 'u1')])
+
+
+class TrajectoryWriter:
+    """
+    Appends experiences to a trajectory file. Use as a context manager, or call close when done, so that the last
+    partial chunk is written too.
+    """
+    def __init__(self, filepath, state_size=5, seed=None, chunk_size=4096):
+        """
+        :param filepath: file to write to, overwritten if it exists
+        :param seed: seed the recorded run was started with, stored in the header so the run can be reproduced
+        :param chunk_size: number of records buffered in memory between writes
+        """
+        self.filepath = filepath
+        self._file = open(filepath, 'wb')
+        header = struct.pack(header_format, magic, version, state_size, -1 if seed is None else seed)
+        self._file.write(header.ljust(header_size, b'\0'))
+        self._chunk = np.zeros(chunk_size, dtype=record_dtype(state_size))
+        # views of each field, so appending only copies values into the chunk
+        self._states = self._chunk['state']
+        self._actions = self._chunk['action']
+        self._rewards = self._chunk['reward']
+        self._next_states = self._chunk['next_state']
+        self._dones = self._chunk['done']
+        self._count = 0
+        self.records = 0
+
+    def append(self, state, action, reward, next_state, done=False):
+        """
+        :param done: True for the last experience of an episode, i.e. when a point was scored or the rally stalled
+        """
+        i = self._count
+        self._states[i] = state
+        self._actions[i] = action
+        self._rewards[i] = reward
+        self._next_states[i] = next_state
+        self._dones[i] = done
+        self._count = i + 1
+        self.records += 1
+        if self._count == len(self._chunk):
+            self.flush()
+
+    def flush(self):
+        if self._count:
+            self._chunk[:self._count].tofile(self._file)
+            self._count = 0
+        self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_header(filepath):
+    """
+    :return: dict with the version, state_size and seed (None if the run wasn't seeded) of a trajectory file
+    """
+    with open(filepath, 'rb') as f:
+        header = f.read(header_size)
+    if len(header) < header_size or header[:len(magic)] != magic:
+        raise ValueError(filepath + " is not a trajectory file")
+    _, file_version, state_size, seed = struct.unpack_from(header_format, header)
+    if file_version != version:
+        raise ValueError(filepath + " has unsupported trajectory version " + str(file_version))
+    return {'version': file_version, 'state_size': state_size, 'seed': None if seed == -1 else seed}
+
+
+def read_trajectory(filepath):
+    """
+    Memory-maps the records of a trajectory file. Nothing is read from disk until the records are accessed, so this
+    works for files of any size.
+    :return: (header, records) where records is a read-only structured array with the fields state, action, reward,
+             next_state and done
+    """
+    header = read_header(filepath)
+    dtype = record_dtype(header['state_size'])
+    with open(filepath, 'rb') as f:
+        f.seek(0, 2)
+        count = (f.tell() - header_size) // dtype.itemsize
+    if count == 0:  # np.memmap can't map an empty region
+        return header, np.zeros(0, dtype=dtype)
+    return header, np.memmap(filepath, dtype=dtype, mode='r', offset=header_size, shape=(count,))
+
+
+def episode_bounds(records):
+    """
+    :return: list of (start, end) index pairs of the episodes in records, each ending with done records. Consecutive
+             done records end the same episode, since both paddles' experiences of the last frame are marked done.
+             A final episode that was cut off before finishing is included too.
+    """
+    done = np.asarray(records['done'], dtype=bool)
+    ends = np.flatnonzero(done & ~np.append(done[1:], False)) + 1
+    starts = np.concatenate(([0], ends[:-1])) if len(ends) else np.zeros(0, dtype=np.int64)
+    bounds = [(int(start), int(end)) for start, end in zip(starts, ends)]
+    last = int(ends[-1]) if len(ends) else 0
+    if last < len(records):
+        bounds.append((last, len(records)))
+    return bounds